@@ -0,0 +1,184 @@
+# Benchmarks of the lexicon build, lookups, and derivations.
+#
+#   python benchmark.py [--quick] [--save-baseline] [--baseline=PATH]
+#
+# Prints the timings as JSON, and compares them against the baseline (by default
+# benchmark_baseline.json next to this file), exiting with status 1 if any of
+# them regressed by more than TOLERANCE.  --save-baseline replaces the baseline
+# with the current timings instead; since timings depend on the machine, the
+# baseline is not checked in.  Everything runs offline; the lexicon cache
+# of the working tree is left untouched.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import grammar
+from grammar import Gender, Label, Number, Person, Stem, Verb
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = next(
+  (arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--baseline=')),
+  os.path.join(DIRECTORY, 'benchmark_baseline.json'))
+QUICK = '--quick' in sys.argv
+# The largest acceptable ratio of a timing to its baseline.
+TOLERANCE = 1.25
+REPEATS = 1 if QUICK else 3
+
+def best_of(repeats: int, run) -> float:
+  # The shortest wall-clock time of `repeats` calls to `run`.
+  best = float('inf')
+  for _ in range(repeats):
+    start = time.perf_counter()
+    run()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def run_python(code: str, cache_path: str, cwd: str = DIRECTORY, *args: str) -> float:
+  # The wall-clock time of a fresh interpreter running `code` (or the script
+  # `args` if `code` is empty) with the given lexicon cache, and without the
+  # cache of the glosses of the laws.
+  environment = dict(os.environ, GLOSSATOR_LEXICON_CACHE=cache_path,
+                     GLOSSATOR_GLOSS_CACHE='', PYTHONPATH=DIRECTORY)
+  command = [sys.executable] + (['-c', code] if code else list(args))
+  start = time.perf_counter()
+  subprocess.run(command, cwd=cwd, env=environment, check=True,
+                 stdout=subprocess.DEVNULL)
+  return time.perf_counter() - start
+
+def benchmark_import(results: dict[str, float], cache_path: str):
+  # The import of the lexicon with the paradigms of the whole inventory.  Cold:
+  # no cache, so the paradigms are derived and the cache written; warm: the
+  # cache is loaded.
+  if os.path.exists(cache_path):
+    os.remove(cache_path)
+  code = 'import lexicon; lexicon.load_all_verbs()'
+  results['import_lexicon_cold_s'] = run_python(code, cache_path)
+  results['import_lexicon_warm_s'] = min(
+    run_python(code, cache_path) for _ in range(REPEATS))
+
+def benchmark_finite_form(results: dict[str, float], verbs: tuple[Verb, ...]):
+  # Derivations per second, by stem and by t/tan variant, with the derivation
+  # cache disabled so that every call derives.
+  persons = [(p, g, n) for n in Number for p in (Person(1), Person(2), Person(3))
+             for g in Gender]
+  maxsize = grammar.derivation_cache.maxsize
+  grammar.derivation_cache.resize(0)
+  try:
+    for stem in Stem:
+      for t in (None, Label.t, Label.tan):
+        calls = [(verb, p, pftv) for verb in (verbs[:8] if QUICK else verbs)
+                 for p in persons for pftv in (False, True)]
+        def run():
+          for verb, p, pftv in calls:
+            verb.finite_form(p, pftv, t=t, stem=stem)
+        results['finite_form_%s%s_per_s' % (stem, t or '')] = (
+          len(calls) / best_of(REPEATS, run))
+  finally:
+    grammar.derivation_cache.resize(maxsize)
+
+def benchmark_load_candidates(results: dict[str, float], cache_path: str):
+  # The latency of the first lookup of the words whose keys have the most
+  # pending loads; each lookup is measured once, in a fresh process, since it
+  # consumes the loads.
+  code = '''
+import collections, json, sys, time
+import lexicon
+lexicon.load_all_verbs()
+counts = collections.Counter(prefix for prefix, _ in lexicon.form_trie.pending_loads())
+words = [prefix for prefix, _ in counts.most_common(%d)]
+latencies = []
+for word in words:
+  start = time.perf_counter()
+  lexicon.load_candidates(word)
+  latencies.append(time.perf_counter() - start)
+json.dump(latencies, sys.stderr)
+''' % (3 if QUICK else 10)
+  environment = dict(os.environ, GLOSSATOR_LEXICON_CACHE=cache_path)
+  latencies = json.loads(subprocess.run(
+    [sys.executable, '-c', code], cwd=DIRECTORY, env=environment, check=True,
+    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr)
+  latencies.sort()
+  results['load_candidates_median_s'] = latencies[len(latencies) // 2]
+  results['load_candidates_max_s'] = latencies[-1]
+
+def synthetic_atf(verbs: tuple[Verb, ...]) -> tuple[str, int]:
+  # An ATF corpus with one law per verb, comprising a few of its forms with and
+  # without suffixes, and the number of words in it.
+  lines = []
+  words = 0
+  for law, verb in enumerate(verbs, 1):
+    lines.append('@law %d' % law)
+    for number, stem in enumerate(Stem, 1):
+      forms = [
+        verb.durative((Person(3), Gender.M, Number.SG), stem=stem).text(),
+        verb.perfective((Person(3), Gender.M, Number.PL), stem=stem, conj=True).text(),
+        verb.perfective((Person(3), Gender.F, Number.SG), t=Label.t, stem=stem,
+                        acc=(Person(3), Gender.M, Number.SG)).text(),
+        verb.durative((Person(2), Gender.M, Number.SG), stem=stem, vent=True).text(),
+      ]
+      words += len(forms) + 1
+      lines.append('%d. x' % number)
+      lines.append('#tr.ts: šumma %s' % ' '.join(forms))
+      lines.append('#tr.en: x')
+  lines.append('@epilogue')
+  return '\n'.join(lines) + '\n', words
+
+def benchmark_gloss_verbs(results: dict[str, float], verbs: tuple[Verb, ...], cache_path: str):
+  atf, words = synthetic_atf(verbs[:6] if QUICK else verbs)
+  with tempfile.TemporaryDirectory() as directory:
+    elapsed = {}
+    for name, text in (('empty', '@epilogue\n'), ('synthetic', atf)):
+      atf_path = os.path.join(directory, name + '.atf')
+      with open(atf_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+      elapsed[name] = min(
+        run_python('', cache_path, directory, os.path.join(DIRECTORY, 'gloss_verbs.py'), atf_path, '--batch')
+        for _ in range(REPEATS))
+  # The startup of gloss_verbs, measured on an empty corpus, is not glossing;
+  # the paradigms of the verbs that the words load are.
+  results['gloss_verbs_words_per_s'] = words / (elapsed['synthetic'] - elapsed['empty'])
+
+def compare(results: dict[str, float], baseline: dict[str, float]) -> list[str]:
+  # The names of the timings that regressed; rates regress by decreasing.
+  regressions = []
+  for name, value in results.items():
+    if name not in baseline:
+      continue
+    ratio = (baseline[name] / value if name.endswith('_per_s') else
+             value / baseline[name])
+    if ratio > TOLERANCE:
+      regressions.append(name)
+  return regressions
+
+def main() -> int:
+  results : dict[str, float] = {}
+  with tempfile.TemporaryDirectory() as directory:
+    cache_path = os.path.join(directory, 'lexicon.cache')
+    benchmark_import(results, cache_path)
+    # Load the lexicon from the cache just built rather than that of the tree.
+    os.environ['GLOSSATOR_LEXICON_CACHE'] = cache_path
+    import lexicon
+    benchmark_finite_form(results, lexicon.verbs)
+    benchmark_load_candidates(results, cache_path)
+    benchmark_gloss_verbs(results, lexicon.verbs, cache_path)
+  print(json.dumps(results, indent=2, sort_keys=True, ensure_ascii=False))
+  if '--save-baseline' in sys.argv:
+    with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+      json.dump(results, f, indent=2, sort_keys=True, ensure_ascii=False)
+    return 0
+  if not os.path.exists(BASELINE_PATH):
+    return 0
+  with open(BASELINE_PATH, encoding='utf-8') as f:
+    baseline = json.load(f)
+  regressions = compare(results, baseline)
+  for name in regressions:
+    print('Regression in %s: %.4g, baseline %.4g' % (name, results[name], baseline[name]),
+          file=sys.stderr)
+  return 1 if regressions else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
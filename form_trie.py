@@ -0,0 +1,118 @@
+from grammar import normalize_n_assimilation, shorten_vowels, ungeminate_consonants
+
+def form_key(text: str) -> str:
+  # The key under which the forms are indexed.
+  return ungeminate_consonants(shorten_vowels(normalize_n_assimilation(text)))
+
+class FormTrieNode:
+  __slots__ = ('children', 'forms', 'pending')
+
+  children: dict[str, "FormTrieNode"]
+  # Forms whose ungeminated key ends at this node, grouped by their normalized,
+  # vowel-shortened text; each set is sorted when read.
+  forms: dict[str, set[str]]
+  # (normalized, vowel-shortened prefix, lazy-loading arguments) whose
+  # prefix, once ungeminated, ends at this node.
+  pending: list[tuple[str, tuple]]
+
+  def __init__(self):
+    self.children = {}
+    self.forms = {}
+    self.pending = []
+
+# A prefix tree over the vowel-shortened, ungeminated surface forms of the
+# lexicon.  Both the forms and the keys of the pending lazy loads are indexed by
+# their ungeminated text, so that the forms compatible with a word and the loads
+# that could contribute to it are found along a single path.
+# The forms are indexed in all their normalizations at once: a node holds the
+# forms by their normalized text (with n assimilated before a consonant, as in
+# the corpus), vowel-shortened, under the ungeminated key.
+class FormTrie:
+  root: FormTrieNode
+
+  def __init__(self):
+    self.root = FormTrieNode()
+
+  def _find(self, key: str) -> FormTrieNode|None:
+    node = self.root
+    for c in key:
+      node = node.children.get(c)
+      if node is None:
+        return None
+    return node
+
+  def _insert(self, key: str) -> FormTrieNode:
+    node = self.root
+    for c in key:
+      child = node.children.get(c)
+      if child is None:
+        child = node.children[c] = FormTrieNode()
+      node = child
+    return node
+
+  def add_form(self, form: str):
+    shortened = shorten_vowels(normalize_n_assimilation(form))
+    self._insert(ungeminate_consonants(shortened)).forms.setdefault(shortened, set()).add(form)
+
+  def add_pending(self, prefix: str, args: tuple):
+    self._insert(ungeminate_consonants(prefix)).pending.append((prefix, args))
+
+  def _path(self, key: str) -> list[FormTrieNode]:
+    # The nodes along `key`, from the root, as far as they go.
+    path = [self.root]
+    for c in key:
+      node = path[-1].children.get(c)
+      if node is None:
+        break
+      path.append(node)
+    return path
+
+  def fuzzy_forms(self, word: str, max_distance: int) -> list[tuple[int, str]]:
+    # The forms whose vowel-shortened, ungeminated text is within `max_distance`
+    # edits of that of `word`, as (distance, form), nearest first.  The trie is
+    # walked with a row of the edit distance table per node, leaving the
+    # subtrees that cannot come within `max_distance`.
+    key = form_key(word)
+    found : list[tuple[int, str]] = []
+    stack = [(self.root, list(range(len(key) + 1)))]
+    while stack:
+      node, row = stack.pop()
+      if row[-1] <= max_distance:
+        found.extend((row[-1], form) for forms in node.forms.values() for form in forms)
+      for c, child in node.children.items():
+        child_row = [row[0] + 1]
+        for i, k in enumerate(key):
+          child_row.append(min(child_row[i] + 1, row[i + 1] + 1, row[i] + (k != c)))
+        if min(child_row) <= max_distance:
+          stack.append((child, child_row))
+    found.sort()
+    return found
+
+  def take_pending(self, key: str) -> list[tuple[str, tuple]]:
+    # Removes and returns the pending loads whose key, once ungeminated, is a
+    # prefix of the form key `key` (see `form_key`), as (key, arguments), longest
+    # key first.  Gemination is ignored, as it is in finding the forms, since the
+    # spelling need not show it.
+    taken : list[tuple[str, tuple]] = []
+    for node in self._path(key):
+      taken += node.pending
+      node.pending = []
+    taken.sort(key=lambda entry: -len(entry[0]))
+    return taken
+
+  def forms_ungeminated(self, key: str) -> list[str]:
+    # The forms whose normalized, vowel-shortened, ungeminated text is that of
+    # the vowel-shortened `key`.
+    return sorted(form for forms in self.forms_by_shortened(key).values() for form in forms)
+
+  def forms_by_shortened(self, key: str) -> dict[str, set[str]]:
+    # As `forms_ungeminated`, by their normalized, vowel-shortened text.
+    node = self._find(ungeminate_consonants(normalize_n_assimilation(key)))
+    return {} if node is None else node.forms
+
+  def pending_loads(self):
+    stack = [self.root]
+    while stack:
+      node = stack.pop()
+      yield from node.pending
+      stack.extend(node.children.values())
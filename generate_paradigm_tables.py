@@ -1,28 +1,32 @@
 from grammar import Verb, Person, Gender, Number, Stem, Label
 
-def append_3cs_conjugation(table, verb: Verb, stem: Stem, **kwargs):
+def append_3cs_conjugation(table, verb: Verb, stem: Stem, t=None):
+  p = (Person(3), Gender.F, Number.SG)
+  forms = verb.paradigm(stem, ((False, t), (True, Label.t), (True, t)) if t is None else
+                              ((False, t), (True, t)),
+                        persons=(p,))
   row = []
-  row.append(verb.durative((Person(3), Gender.F, Number.SG), stem=stem, **kwargs).text())
-  if 't' not in kwargs:
-    row.append(verb.perfective((Person(3), Gender.F, Number.SG), stem=stem, t=Label.t, **kwargs).text())
+  row.append(forms[(p, False, t)].text())
+  if t is None:
+    row.append(forms[(p, True, Label.t)].text())
   else:
     row.append('NYI')
-  row.append(verb.perfective((Person(3), Gender.F, Number.SG), stem=stem, **kwargs).text())
+  row.append(forms[(p, True, t)].text())
   table.append(row)
 
 def complete_conjugation(verb: Verb, stem: Stem):
   table = []
+  tenses = ((False, None), (True, Label.t), (True, None))
   for number in (Number.SG, Number.PL):
-    for person in (Person(3), Person(2), Person(1)):
-      for gender in ((Gender.M, Gender.F)
-                      if (person, number) in ((Person(2), Number.SG),
-                                              (Person(3), Number.PL)) else
-                      (Gender.F,)):
-        row = []
-        row.append(verb.durative((person, gender, number), stem=stem).text())
-        row.append(verb.perfective((person, gender, number), stem=stem, t=Label.t).text())
-        row.append(verb.perfective((person, gender, number), stem=stem).text())
-        table.append(row)
+    persons = [(person, gender, number)
+               for person in (Person(3), Person(2), Person(1))
+               for gender in ((Gender.M, Gender.F)
+                              if (person, number) in ((Person(2), Number.SG),
+                                                      (Person(3), Number.PL)) else
+                              (Gender.F,))]
+    forms = verb.paradigm(stem, tenses, persons)
+    for p in persons:
+      table.append([forms[(p, pftv, t)].text() for pftv, t in tenses])
     if number == Number.SG:
       table.append([''] * 3)
   return table
@@ -0,0 +1,58 @@
+# Writes the glosses of the verbs as one record per candidate gloss, in JSON
+# lines or CSV, so that they can be read without parsing glosses.txt.  The
+# records are written as they are made, so that only the current law is held in
+# memory.
+
+import csv
+import json
+from typing import IO, Any, Iterator
+
+from grammar import KamilDecomposition
+
+FORMATS = ('jsonl', 'csv')
+
+# The fields of a record.  The word is as in the text, and the form is that of
+# the gloss, which differs for fuzzy matches and transliterations; candidates is
+# the number of candidate glosses of the word.
+FIELDS = ('law', 'line', 'word', 'form', 'candidates', 'root', 'stem', 'tense', 'features',
+          'segmentation', 'reconstruction', 'gloss')
+
+def gloss_records(law: int, line_number: str, word: str, glosses: list[KamilDecomposition]) -> Iterator[dict[str, Any]]:
+  for gloss in glosses:
+    yield {
+      'law': law,
+      'line': line_number,
+      'word': word,
+      'form': gloss.text(),
+      'candidates': len(glosses),
+      'root': gloss.root,
+      'stem': str(gloss.stem()),
+      'tense': gloss.tense(),
+      'features': [str(f) for f in gloss.features()],
+      'segmentation': gloss.segmentation(),
+      'reconstruction': gloss.reconstruction(),
+      'gloss': gloss.gloss(),
+    }
+
+class JsonLinesWriter:
+  def __init__(self, f: IO[str]):
+    self.f = f
+
+  def write(self, record: dict[str, Any]):
+    print(json.dumps(record, ensure_ascii=False), file=self.f)
+
+class CsvWriter:
+  # The features are separated by spaces.
+  def __init__(self, f: IO[str]):
+    self.writer = csv.DictWriter(f, FIELDS, lineterminator='\n')
+    self.writer.writeheader()
+
+  def write(self, record: dict[str, Any]):
+    self.writer.writerow(dict(record, features=' '.join(record['features'])))
+
+def record_writer(f: IO[str], format: str) -> JsonLinesWriter|CsvWriter:
+  if format == 'jsonl':
+    return JsonLinesWriter(f)
+  if format == 'csv':
+    return CsvWriter(f)
+  raise ValueError('Unknown record format %s; expected one of %s' % (format, ', '.join(FORMATS)))
@@ -0,0 +1,145 @@
+# A resident glossing service, which keeps the lexicon and the derivation cache
+# warm between requests.
+#
+#   python gloss_server.py [--socket=PATH]
+#
+# Reads requests as JSON lines from stdin, or from each connection to the Unix
+# domain socket PATH, and answers each with a JSON line:
+#   {"gloss": ["iddima", ...]}
+#     -> {"glosses": {"iddima": [{"form": "iddimma", "gloss": "..."}, ...], ...}}
+#   {"gloss": ["id-di-ma"], "transliteration": true}
+#     -> the same, for syllabic transliterations.
+#   {"query": ["Š", "√kšd"]}
+#     -> {"forms": [{"form": "ušakšad", "gloss": "..."}, ...]}
+#   {"conjugate": "prs", "stem": "G"}
+#     -> {"paradigm": [{"tense": "IMPFV", "person": "3.M.SG", "form": "iparras",
+#                       "gloss": "..."}, ...]}
+# The theme vowels of "conjugate" are those of the verb in the inventory unless
+# given as "durative_vowel" and "perfective_vowel"; without "stem", all stems
+# are conjugated.  The "id" of a request, if any, is echoed back; a request that
+# cannot be answered gets {"error": message}.  "query" finds the forms of the
+# lexicon whose glosses have all the given features, named as in the glosses or
+# as stems, such as "tan", "IMPFV", or "ACC.3.F.SG"; only the suffixed forms
+# loaded by earlier lookups are found.
+
+import io
+import json
+import os
+import socketserver
+import stat
+import sys
+from typing import IO
+
+import grammar
+from grammar import ALL_PERSONS, TENSES, Label, Stem, Verb
+import lexicon
+
+socket_path = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--socket=')),
+                   None)
+
+def word_glosses(word: str, transliteration: bool) -> list[dict[str, str]]:
+  candidates = (lexicon.spelled_glosses(word) if transliteration else
+                lexicon.candidate_glosses(grammar.normalize_n_assimilation(word)))
+  return [{'form': form, 'gloss': str(gloss)}
+          for form, glosses in candidates for gloss in glosses]
+
+def query(names: list[str]) -> list[dict[str, str]]:
+  features = lexicon.features_by_name()
+  unknown = [name for name in names if name not in features]
+  if unknown:
+    raise ValueError('unknown features %s' % ', '.join(unknown))
+  return [{'form': form, 'gloss': str(gloss)}
+          for form, gloss in lexicon.feature_query(*(features[name] for name in names))]
+
+def inventory_verb(root: str) -> Verb:
+  for verb in lexicon.verbs:
+    if verb.root == root:
+      return verb
+  raise ValueError('%s is not in the inventory; give its theme vowels' % root)
+
+def paradigm(request: dict) -> list[dict[str, str]]:
+  root = request['conjugate']
+  if not (isinstance(root, str) and len(root) == 3 and all(c in grammar.CONSONANTS for c in root)):
+    raise ValueError('%r is not a root of three consonants' % (root,))
+  if 'durative_vowel' in request and 'perfective_vowel' in request:
+    for vowel in (request['durative_vowel'], request['perfective_vowel']):
+      if vowel not in grammar.SHORT_VOWELS:
+        raise ValueError('%r is not a theme vowel' % (vowel,))
+    verb = Verb(root, request['durative_vowel'], request['perfective_vowel'])
+  else:
+    verb = inventory_verb(root)
+  stems = [Stem[request['stem']]] if 'stem' in request else list(Stem)
+  rows = []
+  for stem in stems:
+    forms = verb.paradigm(stem)
+    for pftv, t in TENSES:
+      tense = '.'.join(str(l) for l in (t, Label.PFTV if pftv else Label.IMPFV) if l)
+      for p in ALL_PERSONS:
+        gloss = forms.get((p, pftv, t))
+        if gloss is None:
+          # This stem and tense are not formed for this verb.
+          continue
+        rows.append({'stem': str(stem), 'tense': tense, 'person': '.'.join(str(x) for x in p),
+                     'form': gloss.text(), 'gloss': str(gloss)})
+  return rows
+
+def string_list(request: dict, field: str) -> list[str]:
+  value = request[field]
+  if not (isinstance(value, list) and all(isinstance(item, str) for item in value)):
+    raise ValueError('"%s" must be a list of strings' % field)
+  return value
+
+def answer(line: str) -> dict:
+  try:
+    request = json.loads(line)
+    if not isinstance(request, dict):
+      raise ValueError('a request must be a JSON object')
+  except ValueError as e:
+    return {'error': str(e)}
+  response : dict = {'id': request['id']} if 'id' in request else {}
+  try:
+    if 'gloss' in request:
+      transliteration = bool(request.get('transliteration'))
+      response['glosses'] = {word: word_glosses(word, transliteration)
+                             for word in string_list(request, 'gloss')}
+    elif 'query' in request:
+      response['forms'] = query(string_list(request, 'query'))
+    elif 'conjugate' in request:
+      response['paradigm'] = paradigm(request)
+    else:
+      raise ValueError('a request must have "gloss", "query" or "conjugate"')
+  except Exception as e:
+    # A request that the grammar cannot handle must not stop the server from
+    # answering the others.
+    response['error'] = '%s: %s' % (type(e).__name__, e)
+  return response
+
+def serve(requests: IO[str], responses: IO[str]):
+  for line in requests:
+    if not line.strip():
+      continue
+    print(json.dumps(answer(line), ensure_ascii=False), file=responses, flush=True)
+
+class RequestHandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    serve(io.TextIOWrapper(self.rfile, encoding='utf-8'),
+          io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True))
+
+if __name__ == '__main__':
+  # The lexicon is loaded once, up front, rather than by the first requests.
+  lexicon.load_all_verbs()
+  if socket_path is None:
+    serve(sys.stdin, sys.stdout)
+  else:
+    if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+      # Left behind by a previous server.
+      os.remove(socket_path)
+    # Requests are answered one connection at a time, since the lexicon is
+    # updated by the lookups.
+    with socketserver.UnixStreamServer(socket_path, RequestHandler) as server:
+      try:
+        server.serve_forever()
+      except KeyboardInterrupt:
+        pass
+      finally:
+        os.remove(socket_path)
@@ -1,102 +1,345 @@
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+import contextlib
+import gc
+import hashlib
+import os
+import pickle
 import re
-import unicodedata
 import sys
 
+import gloss_records
 import grammar
 import lexicon
+from lexicon_shards import law_entries
+import root_guesser
 
-with open(sys.argv[1], "r", encoding="utf-8") as f:
-  atf_lines = f.read().splitlines()
-
-word_counts : dict[str, int] = defaultdict(int)
-verbs_by_law: defaultdict[int, list[tuple[str, str, list[grammar.KamilDecomposition]]]] = defaultdict(list)
-
-law = None
-line_number = None
+# In batch mode, the script neither shows the candidate glosses nor waits for
+# input after each translation line, so that it can run unattended.
+batch = '--batch' in sys.argv
+# In transliteration mode, the words are looked up from the syllabic
+# transliteration on the numbered lines rather than from the normalized
+# transcription on the #tr.ts lines.
+transliteration = '--transliteration' in sys.argv
+# With --guess-roots, a word of the normalized transcription with no glosses gets
+# those of the roots guessed from its shape, for verbs missing from the lexicon.
+guess_roots = '--guess-roots' in sys.argv
+# With --fuzzy=N, a word with no glosses gets those of the forms nearest to it,
+# up to N edits away, ignoring vowel length and gemination; this recovers some
+# damaged or variant spellings.
+fuzzy_distance = next((int(arg.split('=', 1)[1]) for arg in sys.argv[1:] if arg.startswith('--fuzzy=')),
+                      0)
+# The number of processes among which batch mode shards the laws, as given by
+# --jobs=N, by default GLOSSATOR_JOBS; 0 means one per CPU.
+jobs = next((int(arg.split('=', 1)[1]) for arg in sys.argv[1:] if arg.startswith('--jobs=')),
+            lexicon.JOBS)
+# With --records=jsonl or --records=csv, the glosses are also written to
+# glosses.jsonl or glosses.csv, one record per candidate gloss; see
+# gloss_records.
+records_format = next((arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--records=')),
+                      None)
+if records_format is not None and records_format not in gloss_records.FORMATS:
+  raise ValueError('Unknown record format %s; expected one of %s' %
+                   (records_format, ', '.join(gloss_records.FORMATS)))
+atf_path = next(arg for arg in sys.argv[1:] if not arg.startswith('--'))
+# In batch mode, the verbs of each law are cached by its lines, the rules, the
+# inventory and the options, so that only the laws that changed are glossed
+# again.  The glosses of a word do not depend on the words before it, except
+# with --fuzzy, which is therefore not cached.  The cache is a directory with
+# one file per law, so that the laws are read and written one at a time.  Set
+# GLOSSATOR_GLOSS_CACHE to use a different directory, or to the empty string to
+# disable the cache.
+GLOSS_CACHE_PATH = (os.environ.get('GLOSSATOR_GLOSS_CACHE', 'glosses.cache')
+                    if batch and not fuzzy_distance else '')
 
 NONVERBS = frozenset(
   ("īnšu",
    "inūma",)
 )
 
-def normalize_n_assimilation(s):
-  return re.sub(r'n([C])'.replace('C', ''.join(grammar.CONSONANTS)), r'\1\1', s)
-
-possible_glosses = []
-
-for atf_line in atf_lines:
-  if atf_line == "@epilogue":
-    break
-  match = re.match(r"@law (\d+)", atf_line)
-  if match:
-    if law:
-      print("=== End of law %d; identified %d verbs" % (law, len(verbs_by_law[law])))
-    law = int(match.group(1))
-    continue
-  if not law:
-    continue
-  print(atf_line)
-  if not atf_line.startswith("#tr.ts:"):
-    if atf_line.startswith("#tr.en:"):
-      for gloss in possible_glosses:
-        characteristics = [
-          f for f in gloss.functions
-          if not any(f in g.functions for g in possible_glosses if g is not gloss)]
-        print('\n'.join('   ' + l for l in str(gloss).split('\n')))
-        if len(possible_glosses) > 1:
-          print('^-- %s' % ' '.join(str(c) for c in characteristics))
-      if possible_glosses:
-        sys.stdin.readline()
-    elif not atf_line.startswith(("#", "$")):
-      line_number = atf_line.split('.', 1)[0]
-    continue
-  if not line_number:
-    raise ValueError("No line number for %s" % atf_line)
+def read_atf_lines(path: str) -> Iterator[str]:
+  # The lines of the ATF file up to the epilogue, read one at a time.
+  with open(path, "r", encoding="utf-8") as f:
+    for atf_line in f:
+      atf_line = atf_line.rstrip("\r\n")
+      if atf_line == "@epilogue":
+        return
+      yield atf_line
+
+def is_numbered_line(atf_line: str) -> bool:
+  return not atf_line.startswith(("#", "$"))
+
+def law_blocks(atf_lines: Iterable[str]) -> Iterator[tuple[int, str|None, list[str]]]:
+  # Yields each law with the number of the line in which it starts and its
+  # lines, as soon as the law is complete.
+  law = None
+  first_line_number = None
+  line_number = None
+  lines : list[str] = []
+  for atf_line in atf_lines:
+    match = re.match(r"@law (\d+)", atf_line)
+    if match:
+      if law:
+        yield law, first_line_number, lines
+      law = int(match.group(1))
+      first_line_number = line_number
+      lines = []
+    elif law:
+      lines.append(atf_line)
+      if is_numbered_line(atf_line):
+        line_number = atf_line.split('.', 1)[0]
+  if law:
+    yield law, first_line_number, lines
+
+def is_glossed_line(atf_line: str) -> bool:
+  return is_numbered_line(atf_line) if transliteration else atf_line.startswith("#tr.ts:")
+
+def line_words(atf_line: str) -> list[str]:
+  if transliteration:
+    return transliterated_words(atf_line)
   # Use U+02BE ʾ MODIFIER LETTER RIGHT HALF RING rather than U+2019 ’ RIGHT
   # SINGLE QUOTATION MARK for the aleph so that the words comprise only letters.
   atf_line = atf_line.replace("’", "ʾ", )
   # Drop the editorial marks, taking the corrected version.
   atf_line = atf_line.replace("<", "").replace(">", "")
-  words = re.split(r"(?:tr.ts|\W)+", atf_line)
-  for word in words:
-    if word:
-      normalized_word = normalize_n_assimilation(word)
-      word_counts[word] += 1
+  return [word for word in re.split(r"(?:tr.ts|\W)+", atf_line) if word]
+
+def transliterated_words(atf_line: str) -> list[str]:
+  # The syllabically spelled words of a numbered line, without determinatives,
+  # damage and editorial marks; logograms and broken signs are skipped.
+  words = []
+  for word in atf_line.split('.', 1)[-1].replace("’", "ʾ").split():
+    word = re.sub(r"\{[^}]*\}|[][⸢⸣#!?<>]", "", word)
+    if word and not re.search(r"[^\w-]|[A-Zx0-9]", word):
+      words.append(word)
+  return words
+
+def normalize_word(word: str) -> str:
+  return word if transliteration else grammar.normalize_n_assimilation(word)
+
+def law_words(lines: list[str]) -> list[str]:
+  # The normalized words of the law that are looked up in the lexicon, in order.
+  return [normalize_word(word)
+          for atf_line in lines if is_glossed_line(atf_line)
+          for word in line_words(atf_line) if word not in NONVERBS]
+
+def take_loads(normalized_word: str) -> list[tuple[tuple, tuple]]:
+  # Removes the pending loads that a lookup of the word would make, returning
+  # their arguments and enclitics.
+  if transliteration:
+    return lexicon.spelling_loads(grammar.spelling_matcher(normalized_word)[0])
+  return lexicon.word_loads(normalized_word)
+
+def word_glosses(normalized_word: str) -> list[grammar.KamilDecomposition]:
+  possible_glosses : list[grammar.KamilDecomposition] = []
+  if False and normalized_word in lexicon.forms_to_glosses:
+    possible_glosses = lexicon.form_glosses(normalized_word)
+  else:
+    for form, glosses in (lexicon.spelled_glosses(normalized_word) if transliteration else
+                          lexicon.candidate_glosses(normalized_word)):
+      possible_glosses += glosses
+  if not possible_glosses and guess_roots and not transliteration:
+    possible_glosses = root_guesser.guessed_glosses(normalized_word)
+  if not possible_glosses and fuzzy_distance:
+    # The unsuffixed forms of all the verbs are searched, but only the suffixed
+    # forms already loaded.
+    nearest = lexicon.form_trie.fuzzy_forms(
+      grammar.spelling_matcher(normalized_word)[0] if transliteration else normalized_word,
+      fuzzy_distance)
+    for distance, form in nearest:
+      if distance > nearest[0][0]:
+        break
+      possible_glosses += lexicon.form_glosses(form)
+  return possible_glosses
+
+def characteristic_masks(glosses: list[grammar.KamilDecomposition]) -> list[int]:
+  # The masks of the functions of each of the glosses that none of the others
+  # has.
+  masks = [gloss.feature_mask for gloss in glosses]
+  # The union of the masks before and after each gloss.
+  before = [0]
+  for mask in masks[:-1]:
+    before.append(before[-1] | mask)
+  after = [0]
+  for mask in reversed(masks[1:]):
+    after.append(after[-1] | mask)
+  after.reverse()
+  return [mask & ~(b | a) for mask, b, a in zip(masks, before, after)]
+
+def gloss_law(line_number: str|None, lines: list[str], glosses_of: Callable[[str], list[grammar.KamilDecomposition]]) -> list[tuple[str, str, list[grammar.KamilDecomposition]]]:
+  # The verbs of the law, as (line number, word, possible glosses), where
+  # `glosses_of` is called on the normalized words in the order of `law_words`.
+  verbs : list[tuple[str, str, list[grammar.KamilDecomposition]]] = []
+  possible_glosses : list[grammar.KamilDecomposition] = []
+  for atf_line in lines:
+    if not batch:
+      print(atf_line)
+    if is_numbered_line(atf_line):
+      line_number = atf_line.split('.', 1)[0]
+    if not is_glossed_line(atf_line):
+      if atf_line.startswith("#tr.en:"):
+        if not batch:
+          for gloss, characteristics in zip(possible_glosses, characteristic_masks(possible_glosses)):
+            print('\n'.join('   ' + l for l in str(gloss).split('\n')))
+            if len(possible_glosses) > 1:
+              # In the order of the gloss rather than that of the mask.
+              characteristic = set(grammar.mask_features(characteristics))
+              print('^-- %s' % ' '.join(str(c) for c in gloss.features() if c in characteristic))
+          if possible_glosses:
+            sys.stdin.readline()
+      continue
+    if not line_number:
+      raise ValueError("No line number for %s" % atf_line)
+    for word in line_words(atf_line):
       if word not in NONVERBS:
-        lexicon.load_candidates(normalized_word)
-        possible_glosses: list[grammar.KamilDecomposition] = []
-        if False and normalized_word in lexicon.forms_to_glosses:
-          possible_glosses = list(lexicon.forms_to_glosses[normalized_word].values())
-        elif grammar.shorten_vowels(normalized_word) in lexicon.shortened_forms_to_forms:
-          for form in lexicon.ungeminated_forms_to_forms[grammar.ungeminate_consonants(grammar.shorten_vowels(normalized_word))]:
-            possible_glosses += list(lexicon.forms_to_glosses[form].values())
+        possible_glosses = glosses_of(normalize_word(word))
         if possible_glosses:
-          verbs_by_law[law].append((line_number, word, possible_glosses))
+          verbs.append((line_number, word, possible_glosses))
+  return verbs
+
+def glossed_laws(blocks: Iterable[tuple[int, str|None, list[str]]]) -> Iterator[tuple[int, list[tuple[str, str, list[grammar.KamilDecomposition]]]]]:
+  # Yields each of the laws given by `law_blocks` with its verbs as soon as the
+  # law is complete.
+  for law, line_number, lines in blocks:
+    verbs = gloss_law(line_number, lines, word_glosses)
+    print("=== End of law %d; identified %d verbs" % (law, len(verbs)))
+    yield law, verbs
+
+def glossed_laws_in_parallel(blocks: Iterable[tuple[int, str|None, list[str]]], jobs: int) -> Iterator[tuple[int, list[tuple[str, str, list[grammar.KamilDecomposition]]]]]:
+  # As `glossed_laws`, with the derivation of the lazily loaded paradigms
+  # sharded by law across `jobs` processes (0 means one per CPU).
+  # The loads are assigned to the first word that takes them, as they would be
+  # serially; the workers derive the paradigms of each law, and their results
+  # are added to the lexicon in the order of the words, just before each word is
+  # looked up.
+  blocks = list(blocks)
+  # The lexicon is long-lived; without this, the collections triggered by
+  # unpickling the results would keep traversing it.
+  gc.freeze()
+  loads = [[take_loads(word) for word in law_words(lines)]
+           for _, _, lines in blocks]
+  with ProcessPoolExecutor(jobs or None) as executor:
+    for (law, line_number, lines), law_loads, entries in zip(blocks, loads, executor.map(law_entries, loads)):
+      word_entries = iter(zip(law_loads, entries))
+      def glosses_of(normalized_word: str) -> list[grammar.KamilDecomposition]:
+        word_loads, load_entries = next(word_entries)
+        for (args, _), entries in zip(word_loads, load_entries):
+          lexicon.add_suffixed_entries(args, entries)
+        return word_glosses(normalized_word)
+      verbs = gloss_law(line_number, lines, glosses_of)
+      print("=== End of law %d; identified %d verbs" % (law, len(verbs)))
+      yield law, verbs
+
+def law_cache_fingerprint() -> str:
+  h = hashlib.sha256(lexicon.fingerprint().encode('utf-8'))
+  for path in (os.path.join(os.path.dirname(os.path.abspath(__file__)), module)
+               for module in ('gloss_verbs.py', 'root_guesser.py')):
+    with open(path, 'rb') as f:
+      h.update(f.read())
+  with open(lexicon.VERBS_PATH, 'rb') as f:
+    h.update(f.read())
+  h.update(repr((transliteration, guess_roots)).encode('utf-8'))
+  return h.hexdigest()
+
+def law_cache_key(fingerprint: str, lines: list[str]) -> str:
+  return hashlib.sha256('\n'.join([fingerprint] + lines).encode('utf-8')).hexdigest()
+
+def open_law_cache() -> set[str]:
+  # The keys of the laws in the cache, creating it if need be; an unusable cache
+  # is left out.
+  if not GLOSS_CACHE_PATH:
+    return set()
+  try:
+    if os.path.isfile(GLOSS_CACHE_PATH):
+      # A cache in the single file of earlier versions.
+      os.remove(GLOSS_CACHE_PATH)
+    os.makedirs(GLOSS_CACHE_PATH, exist_ok=True)
+    return set(os.listdir(GLOSS_CACHE_PATH))
+  except OSError:
+    return set()
+
+def load_cached_law(key: str) -> list[tuple[str, str, list[grammar.KamilDecomposition]]]|None:
+  try:
+    with open(os.path.join(GLOSS_CACHE_PATH, key), 'rb') as f:
+      return pickle.load(f)
+  except Exception:
+    # A missing, truncated, or otherwise unreadable law is just glossed again.
+    return None
+
+def save_cached_law(key: str, verbs: list[tuple[str, str, list[grammar.KamilDecomposition]]]):
+  path = os.path.join(GLOSS_CACHE_PATH, key)
+  temporary_path = '%s.%d.tmp' % (path, os.getpid())
+  try:
+    with open(temporary_path, 'wb') as f:
+      pickle.dump(verbs, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+  except OSError:
+    if os.path.exists(temporary_path):
+      os.remove(temporary_path)
+
+def prune_law_cache(used: set[str]):
+  # Removes the laws that were not in this run.
+  try:
+    for name in os.listdir(GLOSS_CACHE_PATH):
+      if name not in used:
+        os.remove(os.path.join(GLOSS_CACHE_PATH, name))
+  except OSError:
+    pass
+
+def cached_glossed_laws(atf_lines: Iterable[str]) -> Iterator[tuple[int, list[tuple[str, str, list[grammar.KamilDecomposition]]]]]:
+  # As `glossed_laws` or `glossed_laws_in_parallel`, taking the verbs of the
+  # laws that are in the cache from it, and glossing only the others.  Only the
+  # laws of this run are kept in the cache.
+  cached_keys = open_law_cache()
+  fingerprint = law_cache_fingerprint()
+  used : set[str] = set()
+  blocks = law_blocks(atf_lines)
+  if batch and jobs != 1:
+    blocks = list(blocks)
+    glossed = glossed_laws_in_parallel(
+      [block for block in blocks if law_cache_key(fingerprint, block[2]) not in cached_keys], jobs)
+  for law, line_number, lines in blocks:
+    key = law_cache_key(fingerprint, lines)
+    verbs = load_cached_law(key) if key in cached_keys else None
+    if verbs is not None:
+      print("=== End of law %d; identified %d verbs" % (law, len(verbs)))
+    else:
+      if batch and jobs != 1 and key not in cached_keys:
+        _, verbs = next(glossed)
+      else:
+        _, verbs = next(glossed_laws([(law, line_number, lines)]))
+      if GLOSS_CACHE_PATH:
+        save_cached_law(key, verbs)
+    used.add(key)
+    yield law, verbs
+  if GLOSS_CACHE_PATH:
+    prune_law_cache(used)
 
 glossed_verbs = 0
 ambiguous_verbs = 0
 
-def akkadian_collation_key(s: str):
-  return unicodedata.normalize(
-    "NFD",
-    s.replace("š", "sz")  # ASCII hacks to sort these letters primary-after
-     .replace("ṣ", "s,")  # the ASCII ones without using proper collation
-     .replace("ṭ", "t,")  # weights.
-     .replace("y", "j")   # y collates equal to j.
-    ).replace("\u0304", "").replace("\u0302", "") # Drop macron and circumflex.
+glossed_words : set[str] = set()
 
-glossed_forms = 0
+if fuzzy_distance:
+  # A damaged word need not have the skeleton of its root, so the paradigms of
+  # all the verbs are loaded before any word is looked up; the loads that the
+  # words take, and thus the glosses, are then the same serially and in
+  # parallel.
+  lexicon.load_all_verbs(jobs)
 
-for word, count in sorted(word_counts.items(), key=lambda kv: (-kv[1], akkadian_collation_key(kv[0]))):
-  normalized_word = normalize_n_assimilation(word)
-  if normalized_word in lexicon.forms_to_glosses or grammar.shorten_vowels(normalized_word) in lexicon.shortened_forms_to_forms:
-    glossed_forms += 1
-
-with open('glosses.txt', 'w', encoding='utf-8') as f:
-  for law, verbs in verbs_by_law.items():
+with (open('glosses.txt', 'w', encoding='utf-8') as f,
+      open('glosses.' + records_format, 'w', encoding='utf-8', newline='')
+      if records_format else contextlib.nullcontext() as records_file):
+  records = records_file and gloss_records.record_writer(records_file, records_format)
+  # Each law is written out as soon as it is glossed, so that only one law is
+  # held in memory at a time.
+  for law, verbs in cached_glossed_laws(read_atf_lines(atf_path)):
     print("Law", law, file=f)
     for line_number, word, glosses in verbs:
+      glossed_words.add(word)
+      if records:
+        for record in gloss_records.gloss_records(law, line_number, word, glosses):
+          records.write(record)
       print("l.", line_number,
             ('~' if any(gloss.text() != word for gloss in glosses) else '') + word,
             file=f)
@@ -105,6 +348,14 @@ with open('glosses.txt', 'w', encoding='utf-8') as f:
         print(gloss, file=f)
       if len(glosses) > 1:
         ambiguous_verbs += 1
+    f.flush()
+    if records_file:
+      records_file.flush()
+
+  # The laws in the cache are not looked up, so the forms glossed are those of
+  # the verbs rather than those found in the lexicon.
+  glossed_forms = len(glossed_words)
+
   for file in (f, sys.stdout):
     print(file=file)
     print("Glossed %d verbs with %d ambiguities" % (glossed_verbs, ambiguous_verbs),
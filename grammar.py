@@ -1,5 +1,12 @@
+from collections import OrderedDict
 from enum import Enum
-from typing import Any, Literal, Optional
+from typing import Any, Hashable, Iterable, Iterator, Literal, Optional
+import atexit
+import bisect
+import functools
+import os
+import sys
+import time
 import unicodedata
 import re
 
@@ -21,6 +28,10 @@ def ungeminate_consonants(s: str) -> str:
   for c in CONSONANTS:
     s = s.replace(2 * c, c)
   return s
+N_BEFORE_CONSONANT = re.compile(r'n([C])'.replace('C', ''.join(CONSONANTS)))
+def normalize_n_assimilation(s: str) -> str:
+  # Assimilates n to a following consonant, which the spelling need not show.
+  return N_BEFORE_CONSONANT.sub(r'\1\1', s)
 
 class Stem(Enum):
   G = 0
@@ -31,19 +42,51 @@ class Stem(Enum):
     return super().__str__().rsplit('.', 1)[-1]
 
 class MetalanguageElement:
-  pass
+  __slots__ = ()
 
-class Person(MetalanguageElement):
-  def __init__(self, *p: Literal[1, 2, 3]):
-    self._p = p
+# The instances of the `InternedElement` subclasses, keyed by class and fields.
+_interned : dict[tuple[type, tuple], "InternedElement"] = {}
+
+# An immutable metalanguage element of which there is a single instance for any
+# given class and fields, so that the derivations share them rather than each
+# carrying its own copies.
+class InternedElement(MetalanguageElement):
+  __slots__ = ('_fields', '_hash')
+  _fields: tuple
+  _hash: int
+
+  def __new__(cls, *fields):
+    element = _interned.get((cls, fields))
+    if element is None:
+      element = super().__new__(cls)
+      object.__setattr__(element, '_fields', fields)
+      object.__setattr__(element, '_hash', hash((cls.__name__,) + fields))
+      _interned[(cls, fields)] = element
+    return element
+  def __setattr__(self, name: str, value: Any):
+    raise AttributeError('%s is immutable' % type(self).__name__)
+  def __delattr__(self, name: str):
+    raise AttributeError('%s is immutable' % type(self).__name__)
+  def __reduce__(self):
+    # Unpickling and copying go through `__new__`, and thus yield the interned
+    # instance.
+    return (type(self), self._fields)
   def __repr__(self) -> str:
-    return '%s%r' % (type(self).__name__, self._p)
-  def __str__(self) -> str:
-    return '|'.join(str(p) for p in self._p)
+    return '%s%r' % (type(self).__name__, self._fields)
   def __eq__(self, other: Any) -> bool:
-    return isinstance(other, Person) and other._p == self._p
+    return self is other or (type(other) is type(self) and other._fields == self._fields)
   def __hash__(self) -> int:
-    return hash(self._p)
+    return self._hash
+
+class Person(InternedElement):
+  __slots__ = ()
+  def __new__(cls, *p: Literal[1, 2, 3]):
+    return super().__new__(cls, *p)
+  @property
+  def _p(self) -> tuple[Literal[1, 2, 3], ...]:
+    return self._fields
+  def __str__(self) -> str:
+    return '|'.join(str(p) for p in self._p)
 
 class Gender(MetalanguageElement, Enum):
   M = 0
@@ -57,27 +100,31 @@ class Number(MetalanguageElement, Enum):
   def __str__(self) -> str:
     return super().__str__().rsplit('.', 1)[-1]
 
-class VerbObject(MetalanguageElement):
+class VerbObject(InternedElement):
+  __slots__ = ()
   _label: str
-  def __init__(self, p: Person, g: Optional[Gender], n: Number):
-    self._p = p
-    self._g = g
-    self._n = n
-  def __repr__(self) -> str:
-    return '%s%r' % (type(self).__name__, (self._p, self._g, self._n))
+  def __new__(cls, p: Person, g: Optional[Gender], n: Number):
+    return super().__new__(cls, p, g, n)
+  @property
+  def _p(self) -> Person:
+    return self._fields[0]
+  @property
+  def _g(self) -> Optional[Gender]:
+    return self._fields[1]
+  @property
+  def _n(self) -> Number:
+    return self._fields[2]
   def __str__(self):
     return '.'.join(str(l) for l in (self._label, self._p, self._g, self._n) if l)
-  def __eq__(self, other: Any) -> bool:
-    return isinstance(other, VerbObject) and other._p == self._p and other._g == self._g and other._n == self._n
-  def __hash__(self) -> int:
-    return hash(self._p)
 
 o = VerbObject(Person(3), Gender.F, Number.PL)
 
 class DirectObject(VerbObject):
+  __slots__ = ()
   _label = 'ACC'
 
 class IndirectObject(VerbObject):
+  __slots__ = ()
   _label = 'DAT'
 
 class Label(MetalanguageElement, Enum):
@@ -94,36 +141,38 @@ class Label(MetalanguageElement, Enum):
   def __str__(self) -> str:
     return super().__str__().rsplit('.', 1)[-1]
 
-class Radical(MetalanguageElement):
-  def __init__(self, n: Literal[1, 2, 3]):
-    self._n = n
+class Radical(InternedElement):
+  __slots__ = ()
+  def __new__(cls, n: Literal[1, 2, 3]):
+    return super().__new__(cls, n)
+  @property
+  def _n(self) -> Literal[1, 2, 3]:
+    return self._fields[0]
   def __repr__(self) -> str:
     return '%s(%r)' % (type(self).__name__, self._n)
   def __str__(self) -> str:
     return 'R' + chr(ord('₁') + self._n - 1)
-  def __eq__(self, other: Any) -> bool:
-    return isinstance(other, Radical) and other._n == self._n
-  def __hash__(self) -> int:
-    return hash(self._n)  
 
-class Root(MetalanguageElement):
-  def __init__(self, root: str):
-    self._root = root
+class Root(InternedElement):
+  __slots__ = ()
+  def __new__(cls, root: str):
+    return super().__new__(cls, root)
+  @property
+  def _root(self) -> str:
+    return self._fields[0]
   def __repr__(self) -> str:
     return '%s(%r)' % (type(self).__name__, (self._root))
   def __str__(self):
     return '√' + self._root
-  def __eq__(self, other: Any) -> bool:
-    return isinstance(other, Root) and other._root == self._root
-  def __hash__(self) -> int:
-    return hash(self._root)
 
 
 class Morpheme:
+  __slots__ = ('text', 'functions', 'infixes')
+
   text: str
   morphographemic_spellings: list[str]
-  functions: list[MetalanguageElement]
-  infixes: list[tuple[int, "Morpheme"]]
+  functions: tuple[MetalanguageElement, ...]
+  infixes: tuple[tuple[int, "Morpheme"], ...]
 
   def plain_text(self):
     t = self.text
@@ -144,10 +193,15 @@ class Morpheme:
             '.'.join(str(f) for f in self.functions[1:])
             if self.infixes else '.'.join(str(f) for f in self.functions))
 
-  def __init__(self, text: str, functions: list[MetalanguageElement], infixes: list[tuple[int, "Morpheme"]] = []):
+  def __init__(self, text: str, functions: Iterable[MetalanguageElement], infixes: Iterable[tuple[int, "Morpheme"]] = ()):
     self.text = text
-    self.functions = list(functions)
-    self.infixes = infixes
+    self.functions = tuple(functions)
+    self.infixes = tuple(infixes)
+
+  def __reduce__(self):
+    # Much smaller and faster to unpickle than the default state of a slotted
+    # object.
+    return (Morpheme, (self.text, self.functions, self.infixes))
 
 def personal_prefix(p: Person, g: Gender, n: Number):
   return (Morpheme('a' if n == Number.SG else 'ni', [p, n]) if p == Person(1) else
@@ -209,77 +263,216 @@ def contract_vowels(v1: str, v2: str) -> str:
     return nfc(nfd(v2)[0] + unicodedata.lookup('COMBINING CIRCUMFLEX ACCENT'))
 
 
+# Sign indices, written as subscripts or as acute and grave accents.
+SIGN_INDICES = re.compile('[₀₁₂₃₄₅₆₇₈₉\u0300\u0301]')
+
+@functools.lru_cache(maxsize=1 << 12)
+def spelling_matcher(transliteration: str) -> tuple[str, re.Pattern[str]]:
+  # The reading of a syllabic transliteration such as i-pa-ar-ra-as without
+  # vowel length or gemination, and a pattern matching the NFD forms that it can
+  # spell.  A vowel is long if it is written plene (CV-V), and may be long
+  # otherwise; a consonant is geminate if it is written twice (VC-CV), and may be
+  # geminate otherwise.
+  signs = [nfc(SIGN_INDICES.sub('', nfd(sign)))
+           for sign in transliteration.split('-') if sign]
+  # (letter, whether it is marked long or geminate).
+  letters : list[list[Any]] = []
+  for sign in signs:
+    for i, c in enumerate(sign):
+      short = shorten_vowels(c)
+      if i == 0 and letters and letters[-1][0] == short:
+        if short in CONSONANTS or len(sign) == 1:
+          # VC-CV or CV-V.
+          letters[-1][1] = True
+        # Otherwise CV-VC, which spells a single vowel.
+        continue
+      letters.append([short, short != c])
+  key = ''.join(letter for letter, _ in letters)
+  pattern = ''.join(
+    re.escape(letter) + ('[%s]' % (MACRON + CIRCUMFLEX) + ('' if marked else '?'))
+    if letter in SHORT_VOWELS else
+    '(?:%s){%s}' % (re.escape(nfd(letter)), '2' if marked else '1,2')
+    for letter, marked in letters)
+  return key, re.compile(pattern)
+
+SYNCOPE = re.compile(
+  "(?:[V][C])+([V])[C][^C]".replace('V', ''.join(SHORT_VOWELS)).replace('C', ''.join(CONSONANTS)))
+
+# The bits that stand for the metalanguage elements in feature masks, assigned
+# in the order in which the elements are first met.  They differ from process to
+# process, so feature masks are not pickled.
+_feature_bits : dict[MetalanguageElement, int] = {}
+
+def feature_mask(features: Iterable[MetalanguageElement]) -> int:
+  mask = 0
+  for f in features:
+    bit = _feature_bits.get(f)
+    if bit is None:
+      bit = _feature_bits[f] = 1 << len(_feature_bits)
+    mask |= bit
+  return mask
+
+def mask_features(mask: int) -> list[MetalanguageElement]:
+  return [f for f, bit in _feature_bits.items() if mask & bit]
+
 class KamilDecomposition:
+  __slots__ = ('root', 'reconstructed', 'morphemes', 'functions', 'syncope', '_overt', '_rewrites', '_feature_mask')
+
   root: str
-  reconstructed: list[Morpheme]
+  # The morphemes given to the constructor, which the rules leave untouched.
+  reconstructed: tuple[Morpheme, ...]
+  # A tuple once the derivation is complete, since derivations are shared
+  # through the derivation cache.
   morphemes: list[Morpheme]
-  functions: set[MetalanguageElement]
+  functions: frozenset[MetalanguageElement]
+  # The index in the text of the vowel lost to syncope, if any.
+  syncope: int|None
+  # The indices of the morphemes with nonempty text, in increasing order; only
+  # present during the derivation.
+  _overt: list[int]
+  # The number of times that the text of a morpheme was changed; only present
+  # during the derivation.
+  _rewrites: int
+  # The `feature_mask` of the functions, once computed.
+  _feature_mask: int
 
   def __init__(self, root: str, morphemes: list[Morpheme]) -> None:
     self.root = root
-    self.reconstructed = list(Morpheme(m.text, m.functions) for m in morphemes if m)
-    self.morphemes = list(Morpheme(m.text, m.functions) for m in morphemes if m)
-    self.functions = set(f for m in self.morphemes for f in m.functions)
-    self.avoid_overlong_consonant_clusters()
-    self.apply_global_a_colouring()
-    self.lose_consonants()
-    self.contract_vowels()
-    self.lengthen_before_suffixes()
-    self.assimilate_t()
-    self.assimilate_object_š()
-    self.assimilate_b()
-    self.assimilate_ventive_dative_m()
-    self.syncopate_vowels()
-    self.assimilate_n()
-    self.merge_root_morphemes()
-    self.functions = set(f for m in self.morphemes for f in m.functions)
+    self.reconstructed = tuple(m for m in morphemes if m)
+    self.morphemes = list(Morpheme(m.text, m.functions) for m in self.reconstructed)
+    self.functions = frozenset(f for m in self.morphemes for f in m.functions)
+    self.syncope = None
+    self._rewrites = 0
+    self._index_overt_morphemes()
+    if rule_profile is None:
+      for rule in RULES:
+        rule(self)
+    else:
+      rule_profile.apply(self)
+    self.morphemes = tuple(self.morphemes)
+    self.functions = frozenset(f for m in self.morphemes for f in m.functions)
+    del self._overt
+    del self._rewrites
+
+  def __getstate__(self):
+    return (None, {name: getattr(self, name) for name in self.__slots__
+                   if name != '_feature_mask' and hasattr(self, name)})
+
+  @property
+  def feature_mask(self) -> int:
+    # The functions as a feature mask, so that the functions of decompositions
+    # can be compared with bitwise operations.
+    try:
+      return self._feature_mask
+    except AttributeError:
+      self._feature_mask = feature_mask(self.functions)
+      return self._feature_mask
 
   def __str__(self):
-    reconstruction = ''.join(m.text for m in self.reconstructed)
+    reconstruction = self.reconstruction()
     actual_text = self.text()
-    return ('-'.join(m.object_language() for m in self.morphemes) +
+    return (self.segmentation() +
             '  (' +
             actual_text +
             ('' if reconstruction == actual_text else ' < *' + reconstruction) +
             ')\n' +
-            '-'.join(m.gloss() for m in self.morphemes))
+            self.gloss())
+
+  def segmentation(self) -> str:
+    return '-'.join(m.object_language() for m in self.morphemes)
+
+  def reconstruction(self) -> str:
+    return ''.join(m.text for m in self.reconstructed)
+
+  def gloss(self) -> str:
+    return '-'.join(m.gloss() for m in self.morphemes)
+
+  def features(self) -> list[MetalanguageElement]:
+    # The functions of the morphemes and of their infixes, in the order of the
+    # glosses, without repetitions.  Unlike `functions`, these include the
+    # functions of the infixes, such as the t infix of aptaras.
+    def morpheme_features(m: Morpheme) -> Iterator[MetalanguageElement]:
+      yield from m.functions[:1]
+      for _, infix in m.infixes:
+        yield from morpheme_features(infix)
+      yield from m.functions[1:]
+    return list(dict.fromkeys(f for m in self.morphemes for f in morpheme_features(m)))
+
+  def stem(self) -> Stem:
+    features = self.features()
+    return (Stem.N if Label.PASS in features else
+            Stem.Š if Label.CAUS in features else
+            Stem.D if Label.D in features else
+            Stem.G)
+
+  def tense(self) -> str:
+    # As in the glosses, e.g., tan.IMPFV for the Gtn durative.
+    features = self.features()
+    return '.'.join(str(l) for l in (Label.t, Label.tan, Label.PFTV, Label.IMPFV)
+                    if l in features)
+
+  def invariant_prefix(self) -> str:
+    # The start of the vowel-shortened text of this form without enclitics that
+    # is also that of its forms with any enclitics.  Only the end of the stem
+    # can change: a final vowel contracts with a vowel-initial enclitic, and a
+    # final consonant assimilates to a consonant-initial one, or, followed by a
+    # vowel, may syncopate the vowel before it, which moves the syncope of the
+    # form, if any, towards the end, or keep a weak radical geminated outside the
+    # D stem from contracting with the vowels around it.  An overt personal
+    # suffix shields the stem.
+    text = self.text()
+    if self.morphemes[-1].text:
+      return shorten_vowels(text)
+    end = len(text)
+    if text.endswith(VOWELS):
+      end -= 1
+    else:
+      if text.endswith(('n', 'b', 'd', 't', 'ṭ', 'ṣ', 'z', 'š')):
+        end -= 1
+      if any(m.text in ('ʾʾ', 'ww', 'yy') and Label.D not in m.functions for m in self.reconstructed):
+        end = min(end, max(text.rfind(v) for v in VOWELS))
+      if self.syncope is None:
+        match = SYNCOPE.search(text + 'a')
+        if match:
+          end = min(end, match.start(1))
+      else:
+        match = SYNCOPE.search(text[:self.syncope] + 'a' + text[self.syncope:] + 'a')
+        if match and match.start(1) != self.syncope:
+          end = min(end, self.syncope, match.start(1))
+    return shorten_vowels(text[:end])
 
   def matches_spelling(self, transliteration: str) -> bool:
-    pattern = re.sub(r"[₀₁₂₃₄₅₆₇₈₉-]", "", transliteration)
-    any_consonant = "[%s]" % ''.join(CONSONANTS)
-    any_vowel = "[%s]" % ''.join(VOWELS)
-    pattern = re.sub(
-      r"(?<!%s)" % any_consonant + "(" + any_consonant + ")" + r"(?!%s)" % any_consonant,
-      r"\1+",
-      pattern)
-    pattern = re.sub(
-      r"(%s)\1\1" % any_vowel,
-      r"\1[%s]" % (MACRON + CIRCUMFLEX),
-      pattern)
-    
+    return spelling_matcher(transliteration)[1].fullmatch(nfd(self.text())) is not None
 
   def text(self):
     return ''.join(m.plain_text() for m in self.morphemes)
-  
+
+  def _index_overt_morphemes(self):
+    self._overt = [i for i, m in enumerate(self.morphemes) if m.text]
+
+  def _set_text(self, i: int, text: str):
+    if text != self.morphemes[i].text:
+      self._rewrites += 1
+    if bool(text) != bool(self.morphemes[i].text):
+      if text:
+        bisect.insort(self._overt, i)
+      else:
+        self._overt.remove(i)
+    self.morphemes[i].text = text
+
   def next_overt_morpheme(self, i: int) -> tuple[int, str]:
-    next_text = ''
-    k = i + 1
-    while k < len(self.morphemes):
-      next_text = self.morphemes[k].text
-      if next_text:
-        break
-      k += 1
-    return (k, next_text)
+    n = bisect.bisect_right(self._overt, i)
+    if n < len(self._overt):
+      k = self._overt[n]
+      return (k, self.morphemes[k].text)
+    return (max(i + 1, len(self.morphemes)), '')
 
   def previous_overt_morpheme(self, i: int) -> tuple[int, str]:
-    previous_text = ''
-    j = i - 1
-    while j >= 0:
-      previous_text = self.morphemes[j].text
-      if previous_text:
-        break
-      j -= 1
-    return (j, previous_text)
+    n = bisect.bisect_left(self._overt, i)
+    if n > 0:
+      j = self._overt[n - 1]
+      return (j, self.morphemes[j].text)
+    return (-1, '')
 
   def avoid_overlong_consonant_clusters(self):
     for i in range(len(self.morphemes)):
@@ -289,10 +482,10 @@ class KamilDecomposition:
         lookahead = (next_text + next_2)
         if (lookahead.startswith(STRONG_CONSONANTS) and
             lookahead[1:].startswith(CONSONANTS)):
-          self.morphemes[i].text = 'ta'
+          self._set_text(i, 'ta')
         elif (lookahead.startswith(WEAK_CONSONANTS) and
               lookahead[1:].startswith(CONSONANTS)):
-          self.morphemes[k].text = ''
+          self._set_text(k, '')
 
   def apply_global_a_colouring(self):
     for i in range(len(self.morphemes)):
@@ -300,24 +493,24 @@ class KamilDecomposition:
           # K p. 528 2.
           (self.morphemes[i].text == 'y' and
            Radical(1) in self.morphemes[i].functions)):
-        for m in self.morphemes:
+        for j, m in enumerate(self.morphemes):
           if m and not (
-              (m.text == 'ā' and m.functions in ([Person(3), Gender.F, Number.PL],
-                                                 [Person(2), Number.PL])) or
-              m.functions == [Label.CONJ] or
+              (m.text == 'ā' and m.functions in ((Person(3), Gender.F, Number.PL),
+                                                 (Person(2), Number.PL))) or
+              m.functions == (Label.CONJ,) or
               any(isinstance(f, VerbObject) for f in m.functions) or
-              m.functions == [Label.VENT]):
-            m.text = nfc(nfd(m.text).replace('a', 'e'))
+              m.functions == (Label.VENT,)):
+            self._set_text(j, nfc(nfd(m.text).replace('a', 'e')))
 
   def lose_consonants(self):
     for i in range(len(self.morphemes)):
+      if not self.morphemes[i].text.startswith(WEAK_CONSONANTS):
+        continue
       j, previous_text = self.previous_overt_morpheme(i)
       k, next_text = self.next_overt_morpheme(i)
       l, next_2 = self.next_overt_morpheme(k)
       _, next_3 = self.next_overt_morpheme(l)
-      if (self.morphemes[i].text and
-          self.morphemes[i].text[0] in WEAK_CONSONANTS and
-          self.morphemes[i].text == 2 * self.morphemes[i].text[0]):
+      if self.morphemes[i].text == 2 * self.morphemes[i].text[0]:
         # We are looking at the ʾʾ in V₁ʾʾV₂C.
         if not previous_text.endswith(SHORT_VOWELS):
           raise ValueError("%s should end with a short vowel in %s" % (previous_text, self))
@@ -333,38 +526,38 @@ class KamilDecomposition:
             # ayyV₂CV₃ becomes iCCV₃,
             # unless the gemination comes from the D-stem.
             if self.morphemes[i].text[0] == 'w':
-              self.morphemes[k].text = 'u'
+              self._set_text(k, 'u')
             elif self.morphemes[i].text[0] == 'y':
-              self.morphemes[k].text = 'i'
+              self._set_text(k, 'i')
           # Otherwise V₁ʾʾV₂CV₃ becomes V₂CCV₃.
-          self.morphemes[i].text = ''
-          self.morphemes[j].text = self.morphemes[j].text[:-1]
-          self.morphemes[l].text *= 2
+          self._set_text(i, '')
+          self._set_text(j, self.morphemes[j].text[:-1])
+          self._set_text(l, 2 * self.morphemes[l].text)
         # We are in a word-final V₁ʾʾV₂C₁ or V₁ʾʾV₂C₁C₂… case,
         # so C₁ cannot be doubled.
         elif Label.D in self.morphemes[i].functions:
           # V₁ʾʾV₂C becomes V̄₂C if the gemination comes from the D-stem.
-          self.morphemes[j].text = self.morphemes[j].text[:-1]
-          self.morphemes[i].text = ''
-          self.morphemes[k].text = nfc(self.morphemes[k].text + MACRON)
+          self._set_text(j, self.morphemes[j].text[:-1])
+          self._set_text(i, '')
+          self._set_text(k, nfc(self.morphemes[k].text + MACRON))
         elif self.morphemes[i].text[0] == 'w' and  self.morphemes[j].text.endswith('a'):
           # awwV₂C > ūV₂C (leading to contraction).
-          self.morphemes[j].text = self.morphemes[j].text[:-1]
-          self.morphemes[i].text = 'ū'
+          self._set_text(j, self.morphemes[j].text[:-1])
+          self._set_text(i, 'ū')
         elif self.morphemes[i].text[0] == 'y' and  self.morphemes[j].text.endswith('a'):
           # ayyV₂C > īV₂C.
-          self.morphemes[j].text = self.morphemes[j].text[:-1]
-          self.morphemes[i].text = 'ī'
+          self._set_text(j, self.morphemes[j].text[:-1])
+          self._set_text(i, 'ī')
         else:
           # Just drop the geminated aleph, e.g., in *išaʾʾam, and let vowel
           # contraction do its thing to get išâm.
-          self.morphemes[i].text = ''
+          self._set_text(i, '')
 
       elif self.morphemes[i].text in WEAK_CONSONANTS:
         if previous_text.endswith(CONSONANTS):
           # CʾV > CʾV̄.
-          self.morphemes[i].text = ''
-          self.morphemes[k].text = nfc(self.morphemes[k].text + MACRON)
+          self._set_text(i, '')
+          self._set_text(k, nfc(self.morphemes[k].text + MACRON))
 
         if (previous_text.endswith(VOWELS) and
             next_text in ('a', 'e') and
@@ -374,117 +567,126 @@ class KamilDecomposition:
           # The a might have turned into an e depending on the ʾ.
           while l > i:
             l -= 1
-            self.morphemes[l].text = ''
+            self._set_text(l, '')
         elif previous_text.endswith('a') and next_text.startswith('a'):
           # awa > ū, aya > ī, aʾa > ā.
-          self.morphemes[j].text = self.morphemes[j].text[:-1]
-          self.morphemes[i].text = ('ū' if self.morphemes[i].text == 'w' else
-                                    'ī' if self.morphemes[i].text == 'y' else
-                                    'ā')
-          self.morphemes[k].text = self.morphemes[k].text[1:]
+          self._set_text(j, self.morphemes[j].text[:-1])
+          self._set_text(i, 'ū' if self.morphemes[i].text == 'w' else
+                            'ī' if self.morphemes[i].text == 'y' else
+                            'ā')
+          self._set_text(k, self.morphemes[k].text[1:])
         elif (self.root == 'hlk' and
               any(isinstance(f, Person) for f in self.morphemes[j].functions) and
               next_text in ('ta', 'tan')):
           # Special-case alākum -t- and -tan- morphemes:
-          self.morphemes[i].text = 't'
+          self._set_text(i, 't')
         elif (self.root == 'hlk' and
               any(isinstance(f, Person) for f in self.morphemes[j].functions)
               and next_2 == 'i'):
           # Special-case alākum PCS:
-          self.morphemes[i].text = self.morphemes[k].text
+          self._set_text(i, self.morphemes[k].text)
         elif (shorten_vowels(previous_text).endswith(SHORT_VOWELS) and
               shorten_vowels(next_text).startswith(CONSONANTS)):
           # H p. 38. (b) VʾC > V̄C.
           if previous_text.endswith(SHORT_VOWELS):
-            self.morphemes[j].text = nfc(previous_text + MACRON)
-          self.morphemes[i].text = ''
+            self._set_text(j, nfc(previous_text + MACRON))
+          self._set_text(i, '')
         elif self.morphemes[i].text != 'w':
           # H p. 38. (a).
-          self.morphemes[i].text = ''
+          self._set_text(i, '')
 
   def assimilate_n(self):
     for i in range(len(self.morphemes)):
+      if not self.morphemes[i].text.endswith('n'):
+        continue
       k, next_text = self.next_overt_morpheme(i)
-      if (self.morphemes[i].text.endswith('n') and
-          next_text.startswith(CONSONANTS) and
+      if (next_text.startswith(CONSONANTS) and
           # H pp. 359 & 450, no assimilation of I-n in the Ntn stem & N perfect.
           not (Radical(1) in self.morphemes[i].functions and
                Radical(2) in self.morphemes[k].functions and
                Label.PASS in self.functions and
                (Label.tan in self.functions or
                 Label.t in self.functions))):
-        self.morphemes[i].text = self.morphemes[i].text[:-1] + next_text[0]
+        self._set_text(i, self.morphemes[i].text[:-1] + next_text[0])
 
   def assimilate_b(self):
     # H p. 49.
     for i in range(len(self.morphemes)):
+      if not self.morphemes[i].text.endswith('b'):
+        continue
       _, next_text = self.next_overt_morpheme(i)
-      if (self.morphemes[i].text.endswith('b') and
-          next_text.startswith('m')):
-        self.morphemes[i].text = self.morphemes[i].text[:-1] + next_text[0]
+      if next_text.startswith('m'):
+        self._set_text(i, self.morphemes[i].text[:-1] + next_text[0])
 
   def assimilate_t(self):
     for i in range(len(self.morphemes)):
+      if not self.morphemes[i].text.startswith('t'):
+        continue
       _, previous_text = self.previous_overt_morpheme(i)
       # H p. 155.
       if ((Label.t in self.morphemes[i].functions or
            Label.tan in self.morphemes[i].functions) and
-          self.morphemes[i].text.startswith('t') and
           previous_text.endswith(('d', 'ṭ', 's', 'ṣ'))):
-        self.morphemes[i].text = previous_text[-1] + self.morphemes[i].text[1:]
+        self._set_text(i, previous_text[-1] + self.morphemes[i].text[1:])
 
   def assimilate_object_š(self):
     for i in range(len(self.morphemes)):
+      if not self.morphemes[i].text.startswith('š'):
+        continue
       j, previous_text = self.previous_overt_morpheme(i)
       # H p. 170.
       if (any(isinstance(f, VerbObject) for f in self.morphemes[i].functions) and
-          self.morphemes[i].text.startswith('š') and
           previous_text.endswith(('d', 't', 'ṭ', 's', 'ṣ', 'z', 'š'))):
-        self.morphemes[j].text = self.morphemes[j].text[:-1] + 's'
-        self.morphemes[i].text = 's' + self.morphemes[i].text[1:]
+        self._set_text(j, self.morphemes[j].text[:-1] + 's')
+        self._set_text(i, 's' + self.morphemes[i].text[1:])
 
   def assimilate_ventive_dative_m(self):
     for i in range(len(self.morphemes)):
+      if not self.morphemes[i].text.endswith('m'):
+        continue
       _, next_text = self.next_overt_morpheme(i)
       # H p. 170.
       if ((Label.VENT in self.morphemes[i].functions or
            any(isinstance(f, IndirectObject) for f in self.morphemes[i].functions)) and
-          self.morphemes[i].text.endswith('m') and
           next_text.startswith(CONSONANTS)):
-        self.morphemes[i].text = self.morphemes[i].text[:-1] + next_text[0]
+        self._set_text(i, self.morphemes[i].text[:-1] + next_text[0])
 
   def syncopate_vowels(self):
-    regex = "(?:[V][C])+([V])[C][^C]".replace('V', ''.join(SHORT_VOWELS)).replace('C', ''.join(CONSONANTS))
-    match = re.search(regex, self.text())
+    match = SYNCOPE.search(self.text())
     if match:
       syncopated_vowel_index = match.start(1)
       i = 0
-      for m in self.morphemes:
-        for l in range(len(m.text)):
-          if i == syncopated_vowel_index:
-            if any(isinstance(f, VerbObject) for f in m.functions):
-              return
-            m.text = m.text[:l] + m.text[l+1:]
+      for k, m in enumerate(self.morphemes):
+        if i + len(m.text) > syncopated_vowel_index:
+          if any(isinstance(f, VerbObject) for f in m.functions):
             return
-          i += 1
+          l = syncopated_vowel_index - i
+          self._set_text(k, m.text[:l] + m.text[l+1:])
+          self.syncope = syncopated_vowel_index
+          return
+        i += len(m.text)
 
   def contract_vowels(self):
     i = 0
     while i < len(self.morphemes):
+      if not self.morphemes[i].text.endswith(VOWELS):
+        i += 1
+        continue
       k, next_text = self.next_overt_morpheme(i)
-      if self.morphemes[i].text.endswith(VOWELS) and next_text.startswith(VOWELS):
+      if next_text.startswith(VOWELS):
         v1 = self.morphemes[i].text[-1]
         v2 = next_text[0]
         contraction = contract_vowels(v1, v2)
         if contraction != v1 + v2:
-          self.morphemes[i].text = self.morphemes[i].text[:-1] + contraction + next_text[1:]
+          self._set_text(i, self.morphemes[i].text[:-1] + contraction + next_text[1:])
           for l in range(i + 1, k + 1):
             for f in self.morphemes[l].functions:
               if f not in self.morphemes[i].functions:
-                self.morphemes[i].functions.append(f)
+                self.morphemes[i].functions += (f,)
           while k > i:
             self.morphemes.pop(k)
             k -= 1
+          self._index_overt_morphemes()
       i += 1
 
   def lengthen_before_suffixes(self):
@@ -492,7 +694,7 @@ class KamilDecomposition:
       if Label.CONJ in m.functions or any(isinstance(f, VerbObject) for f in m.functions):
         k, previous = self.previous_overt_morpheme(i)
         if previous.endswith(SHORT_VOWELS):
-          self.morphemes[k].text = nfc(self.morphemes[k].text + MACRON)
+          self._set_text(k, nfc(self.morphemes[k].text + MACRON))
 
   def merge_root_morphemes(self):
     root_morpheme = ''
@@ -521,6 +723,157 @@ class KamilDecomposition:
     root_functions.remove(Radical(2))
     root_functions.remove(Radical(3))
     self.morphemes = self.morphemes[:root_start] + [Morpheme(root_morpheme, root_functions, infixes)] + self.morphemes[root_end + 1:]
+    self._index_overt_morphemes()
+
+# The phonological rules, in the order in which they apply.
+RULES = (
+  KamilDecomposition.avoid_overlong_consonant_clusters,
+  KamilDecomposition.apply_global_a_colouring,
+  KamilDecomposition.lose_consonants,
+  KamilDecomposition.contract_vowels,
+  KamilDecomposition.lengthen_before_suffixes,
+  KamilDecomposition.assimilate_t,
+  KamilDecomposition.assimilate_object_š,
+  KamilDecomposition.assimilate_b,
+  KamilDecomposition.assimilate_ventive_dative_m,
+  KamilDecomposition.syncopate_vowels,
+  KamilDecomposition.assimilate_n,
+  KamilDecomposition.merge_root_morphemes,
+)
+
+# The number of calls, the cumulative time, and the number of rewrites (changes
+# to the text of a morpheme) of each of the phonological rules, recorded by
+# `KamilDecomposition` while profiling is enabled.  Merging the root morphemes
+# rewrites no text.
+class RuleProfile:
+  calls: dict[str, int]
+  seconds: dict[str, float]
+  rewrites: dict[str, int]
+
+  def __init__(self):
+    self.clear()
+
+  def apply(self, decomposition: KamilDecomposition):
+    for rule in RULES:
+      rewrites = decomposition._rewrites
+      start = time.perf_counter()
+      rule(decomposition)
+      elapsed = time.perf_counter() - start
+      name = rule.__name__
+      self.calls[name] += 1
+      self.seconds[name] += elapsed
+      self.rewrites[name] += decomposition._rewrites - rewrites
+
+  def clear(self):
+    self.calls = {rule.__name__: 0 for rule in RULES}
+    self.seconds = {rule.__name__: 0.0 for rule in RULES}
+    self.rewrites = {rule.__name__: 0 for rule in RULES}
+
+  def statistics(self) -> dict[str, dict[str, int|float]]:
+    return {name: {'calls': self.calls[name], 'seconds': self.seconds[name],
+                   'rewrites': self.rewrites[name]}
+            for name in self.calls}
+
+  def report(self) -> str:
+    # A table of the rules, costliest first.
+    width = max(len(name) for name in self.calls)
+    lines = ['%s %9s %9s %10s %9s' % ('rule'.ljust(width), 'calls', 'rewrites', 'seconds', 'µs/call')]
+    for name in sorted(self.calls, key=lambda name: -self.seconds[name]):
+      lines.append('%s %9d %9d %10.3f %9.1f' % (
+        name.ljust(width), self.calls[name], self.rewrites[name], self.seconds[name],
+        1e6 * self.seconds[name] / self.calls[name] if self.calls[name] else 0))
+    return '\n'.join(lines)
+
+# The profile of the rules, or None when profiling is disabled, as it is unless
+# GLOSSATOR_PROFILE_RULES is set, in which case the report is printed to stderr
+# at exit.  Only derivations made in this process are profiled; in particular,
+# a lexicon loaded from the cache makes none.
+rule_profile : RuleProfile|None = None
+
+def enable_rule_profiling() -> RuleProfile:
+  global rule_profile
+  if rule_profile is None:
+    rule_profile = RuleProfile()
+  return rule_profile
+
+def disable_rule_profiling():
+  global rule_profile
+  rule_profile = None
+
+def print_rule_profile():
+  if rule_profile is not None:
+    print(rule_profile.report(), file=sys.stderr)
+
+if os.environ.get('GLOSSATOR_PROFILE_RULES'):
+  enable_rule_profiling()
+  atexit.register(print_rule_profile)
+
+# A least-recently-used cache of derivations, which keeps at most `maxsize`
+# entries (any number if `maxsize` is None, none if it is 0).
+class DerivationCache:
+  maxsize: int|None
+  hits: int
+  misses: int
+  evictions: int
+  _entries: OrderedDict[Hashable, KamilDecomposition]
+
+  def __init__(self, maxsize: int|None):
+    self.maxsize = maxsize
+    self._entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def get(self, key: Hashable) -> KamilDecomposition|None:
+    gloss = self._entries.get(key)
+    if gloss is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+      self._entries.move_to_end(key)
+    return gloss
+
+  def put(self, key: Hashable, gloss: KamilDecomposition):
+    if self.maxsize == 0:
+      return
+    self._entries[key] = gloss
+    if self.maxsize is not None and len(self._entries) > self.maxsize:
+      self._entries.popitem(last=False)
+      self.evictions += 1
+
+  def resize(self, maxsize: int|None):
+    self.maxsize = maxsize
+    while maxsize is not None and len(self._entries) > maxsize:
+      self._entries.popitem(last=False)
+      self.evictions += 1
+
+  def clear(self):
+    self._entries.clear()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def statistics(self) -> dict[str, int|None]:
+    return {'size': len(self._entries), 'maxsize': self.maxsize,
+            'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+# The derivations made by `Verb.finite_form`, keyed by the root, the theme
+# vowels, and the arguments.  GLOSSATOR_DERIVATION_CACHE_SIZE sets the number of
+# derivations kept; a negative size keeps all of them.
+_cache_size = int(os.environ.get('GLOSSATOR_DERIVATION_CACHE_SIZE', 1 << 14))
+derivation_cache = DerivationCache(_cache_size if _cache_size >= 0 else None)
+
+# The persons of a paradigm, by number, person, and gender.
+ALL_PERSONS : list[tuple[Person, Gender, Number]] = [
+  (p, g, n) for n in Number for p in (Person(1), Person(2), Person(3)) for g in Gender]
+
+# The tenses of a paradigm, as (perfective, t or tan infix).
+TENSES : tuple[tuple[bool, None|Literal[Label.t, Label.tan]], ...] = (
+  (False, None), (True, None), (True, Label.t), (False, Label.t), (False, Label.tan))
+
 class Verb:
   root: str
   durative_vowel: str
@@ -541,17 +894,41 @@ class Verb:
       stem: Stem = Stem.G,
       acc: tuple[Person, Gender, Number]|None = None,
       dat: tuple[Person, Gender, Number]|None = None) -> KamilDecomposition:
-    if ((acc and acc[0] == 1 and acc[-1] == Number.SG) or
-        (dat and dat[0] == 1 and dat[-1] == Number.SG)):
-      vent = True
-    if vent:
-      subj = False
-    d_prefix = stem in (Stem.D, Stem.Š) or (
+    key = (self.root, self.durative_vowel, self.perfective_vowel,
+           p, pftv, t, subj, conj, vent, stem, acc, dat)
+    gloss = derivation_cache.get(key)
+    if gloss is None:
+      gloss = self.derive_finite_form(p, pftv, t, subj, conj, vent, stem, acc, dat)
+      derivation_cache.put(key, gloss)
+    return gloss
+
+  def derive_finite_form(
+      self,
+      p: tuple[Person, Gender, Number],
+      pftv: bool,
+      t: None|Literal[Label.t, Label.tan],
+      subj: bool,
+      conj: bool,
+      vent: bool,
+      stem: Stem,
+      acc: tuple[Person, Gender, Number]|None,
+      dat: tuple[Person, Gender, Number]|None) -> KamilDecomposition:
+    return self.inflect(p, self.takes_d_prefix(stem), self.stem_morphemes(pftv, t, stem),
+                        subj, conj, vent, acc, dat)
+
+  def takes_d_prefix(self, stem: Stem) -> bool:
+    return stem in (Stem.D, Stem.Š) or (
       self.root.startswith('w') and
       (self.durative_vowel == 'a' or self.root.endswith(WEAK_CONSONANTS)))
+
+  def stem_morphemes(
+      self,
+      pftv: bool,
+      t: None|Literal[Label.t, Label.tan],
+      stem: Stem) -> list[Morpheme]:
+    # The morphemes between the personal prefix and the personal suffix, which
+    # are the same for all persons.
     morphemes : list[Morpheme] = []
-    morphemes.append(personal_prefix_d(*p) if d_prefix else
-                     personal_prefix(*p))
     if stem == Stem.N:
       morphemes.append(Morpheme('n', [Label.PASS]))
     if stem == Stem.Š:
@@ -611,6 +988,29 @@ class Verb:
                  [Label.IMPFV]))
 
     morphemes.append(Morpheme(self.root[-1], [Radical(3)]))
+    return morphemes
+
+  def inflect(
+      self,
+      p: tuple[Person, Gender, Number],
+      d_prefix: bool,
+      stem_morphemes: list[Morpheme],
+      subj: bool,
+      conj: bool,
+      vent: bool,
+      acc: tuple[Person, Gender, Number]|None,
+      dat: tuple[Person, Gender, Number]|None) -> KamilDecomposition:
+    # The form for the person `p` whose stem morphemes are given by
+    # `stem_morphemes`.
+    if ((acc and acc[0] == 1 and acc[-1] == Number.SG) or
+        (dat and dat[0] == 1 and dat[-1] == Number.SG)):
+      vent = True
+    if vent:
+      subj = False
+    morphemes : list[Morpheme] = []
+    morphemes.append(personal_prefix_d(*p) if d_prefix else
+                     personal_prefix(*p))
+    morphemes.extend(stem_morphemes)
     p_suffix = personal_suffix(*p, gloss_for_d=d_prefix)
     morphemes.append(p_suffix)
     if subj and not p_suffix.text:
@@ -627,6 +1027,41 @@ class Verb:
       morphemes.append(Morpheme('ma', [Label.CONJ]))
     return KamilDecomposition(self.root, morphemes)
 
+  def paradigm(
+      self,
+      stem: Stem = Stem.G,
+      tenses: Iterable[tuple[bool, None|Literal[Label.t, Label.tan]]] = TENSES,
+      persons: Iterable[tuple[Person, Gender, Number]] = ALL_PERSONS,
+      subj: bool = False,
+      conj: bool = False,
+      vent: bool = False,
+      acc: tuple[Person, Gender, Number]|None = None,
+      dat: tuple[Person, Gender, Number]|None = None) -> dict[tuple[tuple[Person, Gender, Number], bool, None|Label], KamilDecomposition]:
+    # The forms of the stem for the given persons and (perfective, t or tan
+    # infix) tenses, with the given enclitics, by (person, perfective, infix),
+    # in that order.  The same as calling `finite_form` for each of them, and
+    # sharing its cache, but the stem morphemes of each tense are built only
+    # once.  The forms that cannot be derived are left out.
+    tenses = list(tenses)
+    d_prefix = self.takes_d_prefix(stem)
+    stem_morphemes : dict[tuple[bool, None|Label], list[Morpheme]] = {}
+    forms : dict[tuple[tuple[Person, Gender, Number], bool, None|Label], KamilDecomposition] = {}
+    for p in persons:
+      for pftv, t in tenses:
+        key = (self.root, self.durative_vowel, self.perfective_vowel,
+               p, pftv, t, subj, conj, vent, stem, acc, dat)
+        gloss = derivation_cache.get(key)
+        if gloss is None:
+          if (pftv, t) not in stem_morphemes:
+            stem_morphemes[(pftv, t)] = self.stem_morphemes(pftv, t, stem)
+          try:
+            gloss = self.inflect(p, d_prefix, stem_morphemes[(pftv, t)], subj, conj, vent, acc, dat)
+          except ValueError:
+            continue
+          derivation_cache.put(key, gloss)
+        forms[(p, pftv, t)] = gloss
+    return forms
+
   def durative(self, p: tuple[Person, Gender, Number], **kwargs):
     return self.finite_form(p, pftv=False, **kwargs)
   def perfective(self, p: tuple[Person, Gender, Number], **kwargs):
@@ -1,174 +1,461 @@
 from collections import defaultdict
-import sys
-from os.path import commonprefix
-
-from grammar import Person, Gender, Number, Label, Verb, KamilDecomposition, Stem, shorten_vowels, ungeminate_consonants, WEAK_CONSONANTS
-
-verbs = (
-  Verb("ʾbr", "i", "i"),  # TODO(egg): which ʾ?
-  Verb("ʾgr", "a", "u"),
-  Verb("ʾḫz", "a", "u"),
-  Verb("hlk", "a", "i"),  # TODO(egg): Needs special-casing.
-  Verb("ʾmr", "a", "u"),
-  Verb("ʾpl", "a", "u"),
-  Verb("bnʾ", "i", "i"),
-  Verb("bšʾ", "i", "i"),
-  Verb("dwk", "a", "u"),
-  Verb("dyn", "a", "i"),
-  Verb("ʿnh", "i", "i"),
-  Verb("ḥpš", "a", "u"),
-  Verb("ḥbb", "i", "i"),
-  Verb("ʿrb", "u", "u"),
-  Verb("ḫlq", "i", "i"),
-  Verb("kwn", "a", "u"),
-  Verb("kšd", "a", "u"),
-  Verb("kšš", "a", "u"),
-  Verb("lmd", "a", "a"),
-  Verb("lqḥ", "a", "a"),
-  Verb("mdd", "a", "u"),
-  Verb("mḫṣ", "a", "a"),
-  Verb("mḫr", "a", "u"),
-  Verb("mqt", "u", "u"),
-  Verb("ndn", "i", "i"),
-  Verb("ndʾ", "i", "i"),
-  Verb("nʾl", "a", "i"),
-  Verb("nks", "i", "i"),
-  Verb("nṣr", "a", "u"),
-  Verb("nšʾ", "i", "i"),
-  Verb("prs", "a", "u"),
-  Verb("pṭr", "a", "u"),
-  Verb("qbʾ", "i", "i"),
-  Verb("qlʾ", "u", "u"),
-  Verb("qyp", "a", "i"),
-  Verb("qyš", "a", "i"),
-  Verb("rks", "a", "u"),
-  Verb("rdḥ", "a", "a"),  # This ḥ is a hack.
-  Verb("ṣbt", "a", "a"),
-  Verb("škn", "a", "u"),
-  Verb("šʾm", "a", "a"),
-  Verb("šlʾ", "i", "i"),
-  Verb("šlm", "i", "i"),
-  Verb("šql", "a", "u"),
-  Verb("šrq", "i", "i"),
-  Verb("tbl", "a", "a"),
-  Verb("twr", "a", "u"),
-  Verb("wbl", "a", "i"),
-  Verb("wṣʾ", "i", "i"),
-  Verb("wšb", "a", "i"),
-)
-
-forms_to_glosses : defaultdict[str, dict[str, KamilDecomposition]] = defaultdict(dict)
-shortened_forms_to_forms : dict[str, list[str]] = defaultdict(list)
-ungeminated_forms_to_forms : dict[str, list[str]] = defaultdict(list)
-
-unloaded_prefixes : defaultdict[str, list[tuple]] = defaultdict(list)
-
-def add_forms(verb : Verb):
-  for stem in Stem:
-    for n in Number:
-      for p in (Person(1), Person(2), Person(3)):
-        for g in Gender:
-          gloss = verb.durative((p, g, n), stem=stem)
-          forms_to_glosses[gloss.text()][str(gloss)] = gloss
-          prefix = gloss.text()
-          for acc in ((1, Gender.F, Number.SG), (2, Gender.F, Number.SG), (3, Gender.F, Number.SG)):
-            prefix = commonprefix(
-              (prefix,
-               verb.durative((p, g, n), stem=stem, acc=acc).text()))
-            unloaded_prefixes[shorten_vowels(prefix)].append((verb, stem, p, g, n, 'impfv'))
-
-          gloss = verb.perfective((p, g, n), stem=stem)
-          forms_to_glosses[gloss.text()][str(gloss)] = gloss
-          prefix = gloss.text()
-          for acc in ((1, Gender.F, Number.SG), (2, Gender.F, Number.SG), (3, Gender.F, Number.SG)):
-            prefix = commonprefix(
-              (prefix,
-               verb.perfective((p, g, n), stem=stem, acc=acc).text()))
-            unloaded_prefixes[shorten_vowels(prefix)].append((verb, stem, p, g, n, 'pftv'))
-
-          gloss = verb.perfective((p, g, n), t=Label.t, stem=stem)
-          forms_to_glosses[gloss.text()][str(gloss)] = gloss
-          prefix = gloss.text()
-          for acc in ((1, Gender.F, Number.SG), (2, Gender.F, Number.SG), (3, Gender.F, Number.SG)):
-            prefix = commonprefix(
-              (prefix,
-               verb.perfective((p, g, n), t=Label.t, stem=stem, acc=acc).text()))
-            unloaded_prefixes[shorten_vowels(prefix)].append((verb, stem, p, g, n, Label.t, 'pftv'))
-
-          if stem != Stem.N:
-            gloss = verb.durative((p, g, n), t=Label.t, stem=stem)
-            forms_to_glosses[gloss.text()][str(gloss)] = gloss
-            prefix = gloss.text()
-            for acc in ((1, Gender.F, Number.SG), (2, Gender.F, Number.SG), (3, Gender.F, Number.SG)):
-              prefix = commonprefix(
-                (prefix,
-                verb.durative((p, g, n), t=Label.t, stem=stem, acc=acc).text()))
-              unloaded_prefixes[shorten_vowels(prefix)].append((verb, stem, p, g, n, Label.t, 'impfv'))
-
-          # H p. 450, no Ntn attested for II-weak and I-w.
-          if not (stem == Stem.N and
-                  (verb.root[1] in WEAK_CONSONANTS or verb.root[0] == 'w')):
-            gloss = verb.durative((p, g, n), t=Label.tan, stem=stem)
-            forms_to_glosses[gloss.text()][str(gloss)] = gloss
-            prefix = gloss.text()
-            for acc in ((1, Gender.F, Number.SG), (2, Gender.F, Number.SG), (3, Gender.F, Number.SG)):
-              prefix = commonprefix(
-                (prefix,
-                verb.durative((p, g, n), t=Label.tan, stem=stem, acc=acc).text()))
-              unloaded_prefixes[shorten_vowels(prefix)].append((verb, stem, p, g, n, Label.tan, 'impfv'))
-
-for verb in verbs:
-  add_forms(verb)
-
-ALL_PERSONS : list[tuple[Person, Gender, Number]] = []
-for n in Number:
-  for p in (Person(1), Person(2), Person(3)):
-    for g in Gender:
-      ALL_PERSONS.append((p, g, n))
-
-def load_suffixed_forms(verb : Verb, stem, p, g, n, *args):
-  for obj in ('acc', 'dat'):
-    for acc in ALL_PERSONS + [None]:
-      for conj in (False, True):
-        for vent in (False, True):
-          for subj in (False,) if vent else (False, True):
-            if 'pftv' in args:
-              gloss = verb.perfective((p, g, n), t=Label.t if Label.t in args else Label.tan if Label.tan in args else None, stem=stem,
-                                      conj=conj, vent=vent, subj=subj, **{obj:acc})
-            else:
-              gloss = verb.durative((p, g, n), t=Label.t if Label.t in args else Label.tan if Label.tan in args else None, stem=stem,
-                                    conj=conj, vent=vent, subj=subj, **{obj:acc})
-            form = gloss.text()
-            if form not in forms_to_glosses:
-              forms = shortened_forms_to_forms[shorten_vowels(form)]
-              if form not in forms:
-                forms.append(form)
-                forms.sort()
-              forms = ungeminated_forms_to_forms[ungeminate_consonants(shorten_vowels(form))]
-              if form not in forms:
-                forms.append(form)
-                forms.sort()
-            forms_to_glosses[form][str(gloss)] = gloss
+import atexit
+import hashlib
+import mmap
+import os
+import pickle
+import re
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+from form_trie import FormTrie, form_key
+from lexicon_shards import SUFFIX_ENDINGS, SUFFIXES, stem_entries, suffixed_forms
+import grammar
+from grammar import (Verb, KamilDecomposition, Stem, WEAK_CONSONANTS, normalize_n_assimilation, shorten_vowels,
+                     ungeminate_consonants)
+
+# The number of processes among which `load_all_verbs` shards the derivations by
+# verb and stem; 0 means one per CPU.
+JOBS = int(os.environ.get('GLOSSATOR_JOBS', 1))
+
+# The verb inventory, read from a file of lines of tab-separated root, durative
+# vowel, perfective vowel and, optionally, the comma-separated stems in which
+# the verb is attested, by default all of them; # starts a comment.  Set
+# GLOSSATOR_VERBS to use a different file.
+VERBS_PATH = os.environ.get(
+  'GLOSSATOR_VERBS',
+  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'verbs.tsv'))
+
+def read_verbs(path: str) -> list[tuple[Verb, tuple[Stem, ...]]]:
+  inventory = []
+  with open(path, encoding='utf-8') as f:
+    for line in f:
+      fields = line.split('#', 1)[0].rstrip().split('\t')
+      if not fields[0]:
+        continue
+      root, durative_vowel, perfective_vowel = fields[:3]
+      stems = (tuple(Stem[stem] for stem in fields[3].split(','))
+               if len(fields) > 3 and fields[3] else tuple(Stem))
+      inventory.append((Verb(root, durative_vowel, perfective_vowel), stems))
+  return inventory
+
+inventory = read_verbs(VERBS_PATH)
+verbs = tuple(verb for verb, _ in inventory)
+
+class CachedGloss:
+  # A gloss in the mapped cache (see `cached_verb_entries`), decoded when it is
+  # first needed.
+  __slots__ = ('offset', 'length', '_gloss')
+
+  def __init__(self, offset: int, length: int):
+    self.offset = offset
+    self.length = length
+    self._gloss : KamilDecomposition|None = None
+
+  def gloss(self) -> KamilDecomposition:
+    if self._gloss is None:
+      self._gloss = pickle.loads(cache_map[self.offset:self.offset + self.length])
+    return self._gloss
+
+def decoded(gloss: KamilDecomposition|CachedGloss) -> KamilDecomposition:
+  return gloss.gloss() if isinstance(gloss, CachedGloss) else gloss
+
+# The glosses of each form, by gloss string; those read from the cache are
+# decoded by the lookups that return them.
+forms_to_glosses : defaultdict[str, dict[str, KamilDecomposition|CachedGloss]] = defaultdict(dict)
+# Indexes the forms by their vowel-shortened, ungeminated text, along with the
+# keys of the suffixed forms that have yet to be loaded.
+form_trie = FormTrie()
+
+# The keys of the pending loads of each paradigm cell, by lazy-loading
+# arguments.
+cell_prefixes : dict[tuple, list[str]] = {}
+
+# The entries of the lexicon in the order in which they were added, as (form,
+# gloss), and the postings of the features of their glosses and of their stems:
+# the indices of the entries that have each of them.  The postings are brought
+# up to date by `feature_query`, so that the lookups pay only for the list.
+lexicon_entries : list[tuple[str, KamilDecomposition|CachedGloss]] = []
+feature_postings : defaultdict[grammar.MetalanguageElement|Stem, set[int]] = defaultdict(set)
+indexed_entries = 0
+
+def add_stem_entries(entries: list[tuple[str, str, KamilDecomposition|CachedGloss]], pending: list[tuple[str, tuple]]):
+  # Adds the (form, gloss string, gloss) entries of the unsuffixed forms of a
+  # verb in a stem, and the pending loads of their suffixed forms.
+  for form, key, gloss in entries:
+    if form not in forms_to_glosses:
+      form_trie.add_form(form)
+    if key not in forms_to_glosses[form]:
+      lexicon_entries.append((form, gloss))
+    forms_to_glosses[form][key] = gloss
+  for prefix, args in pending:
+    form_trie.add_pending(prefix, args)
+    cell_prefixes.setdefault(args, []).append(prefix)
+
+def root_skeleton(root: str) -> str:
+  # A pattern that the form key of every form of the root matches: its radicals
+  # in order, leaving out the weak ones and n, which may be lost or assimilated;
+  # b may assimilate to m, and a final dental or sibilant to s, before the
+  # enclitics, and geminate radicals may be one consonant once ungeminated.
+  radicals : list[str] = []
+  previous = None
+  for i, c in enumerate(root):
+    if c in WEAK_CONSONANTS or c == 'n' or c == previous:
+      continue
+    radicals.append('[%s%s%s]' % (c, 'm' if c == 'b' else '',
+                                  's' if i == len(root) - 1 and c in 'dtṭṣzš' else ''))
+    previous = c
+  return '.*'.join(radicals)
+
+# The paradigms are derived by verb when first needed, that is, when a word
+# could be one of their forms: the verbs whose paradigms have yet to be added,
+# with their stems, by the skeleton of their root.
+unloaded_verbs : dict[str, list[tuple[Verb, tuple[Stem, ...]]]] = {}
+for verb, stems in inventory:
+  unloaded_verbs.setdefault(root_skeleton(verb.root), []).append((verb, stems))
+compiled_skeletons = {skeleton: re.compile(skeleton) for skeleton in unloaded_verbs}
+
+# The entries derived by `stem_entries` or read from the cache, by verb and
+# stems, as the (form, gloss string, gloss) entries and the pending loads of
+# each stem, and the keys of those derived by this process.
+verb_entries : dict[str, list[tuple[list[tuple[str, str, KamilDecomposition|CachedGloss]], list[tuple[str, tuple]]]]] = {}
+derived_keys : list[str] = []
+
+def verb_entries_key(verb: Verb, stems: tuple[Stem, ...]) -> str:
+  return '\t'.join((verb.root, verb.durative_vowel, verb.perfective_vowel,
+                    ','.join(str(stem) for stem in stems)))
+
+def add_verbs(verbs_and_stems: list[tuple[Verb, tuple[Stem, ...]]], jobs: int = 1):
+  # Adds the paradigms of the given verbs, deriving those that are not cached,
+  # sharded by verb and stem among `jobs` processes unless `jobs` is 1.
+  underived = []
+  for verb, stems in verbs_and_stems:
+    key = verb_entries_key(verb, stems)
+    if key not in verb_entries:
+      entries = cached_verb_entries(key)
+      if entries is None:
+        underived.append((verb, stems))
+      else:
+        verb_entries[key] = entries
+  shards = [(verb, stem) for verb, stems in underived for stem in stems]
+  if jobs == 1 or len(shards) < 2:
+    entries = iter([stem_entries(verb, stem) for verb, stem in shards])
+  else:
+    with ProcessPoolExecutor(jobs or None) as executor:
+      # `map` yields the results in the order of the shards, so that the merged
+      # lexicon is the same as that of a serial build.
+      entries = iter(list(executor.map(stem_entries, *zip(*shards))))
+  for verb, stems in underived:
+    key = verb_entries_key(verb, stems)
+    verb_entries[key] = [([(gloss.text(), str(gloss), gloss) for gloss in glosses], pending)
+                         for glosses, pending in (next(entries) for _ in stems)]
+    derived_keys.append(key)
+  for verb, stems in verbs_and_stems:
+    for stem_glosses, pending in verb_entries[verb_entries_key(verb, stems)]:
+      add_stem_entries(stem_glosses, pending)
+
+def load_verbs(key: str):
+  # Adds the paradigms of the verbs of which a word with the given form key
+  # could be a form.
+  loaded = [skeleton for skeleton in unloaded_verbs
+            if compiled_skeletons[skeleton].search(key)]
+  add_verbs([verb_and_stems for skeleton in loaded
+             for verb_and_stems in unloaded_verbs.pop(skeleton)])
+
+def load_all_verbs(jobs: int = JOBS):
+  add_verbs([verb_and_stems for skeleton in list(unloaded_verbs)
+             for verb_and_stems in unloaded_verbs.pop(skeleton)], jobs)
+
+# The lazy-loading arguments of the paradigm cells from which the suffixed
+# glosses were loaded, by (form, gloss string); the glosses that are also
+# unsuffixed are not in here.
+suffixed_cells : dict[tuple[str, str], set[tuple]] = {}
+
+def add_suffixed_entries(args: tuple, entries: Iterable[tuple[str, str, KamilDecomposition|CachedGloss]]):
+  # Adds the given (form, gloss string, gloss) entries, loaded from the paradigm
+  # cell with the given lazy-loading arguments.
+  for form, key, gloss in entries:
+    if form not in forms_to_glosses:
+      form_trie.add_form(form)
+    glosses = forms_to_glosses[form]
+    if key not in glosses:
+      glosses[key] = gloss
+      lexicon_entries.append((form, gloss))
+      suffixed_cells[(form, key)] = {args}
+    elif (form, key) in suffixed_cells:
+      suffixed_cells[(form, key)].add(args)
+
+def load_suffixed_forms(verb : Verb, stem, p, g, n, *args, suffixes=SUFFIXES):
+  add_suffixed_entries((verb, stem, p, g, n) + args, (
+    (gloss.text(), str(gloss), gloss)
+    for gloss in suffixed_forms(verb, stem, p, g, n, *args, suffixes=suffixes)))
+
+# The enclitics of the partially loaded paradigm cells that have yet to be
+# derived, by lazy-loading arguments; the cells missing from here have none
+# derived yet.
+unloaded_suffixes : dict[tuple, tuple] = {}
+
+def take_loads(key: str, pending: list[tuple[str, tuple]]) -> list[tuple[tuple, tuple]]:
+  # The (arguments, enclitics) of the derivations needed by a word with the
+  # given form key from the pending loads that it took.  Only the enclitics that
+  # the word can end with are derived; a cell with others left stays pending
+  # under all of its keys.
+  loads = []
+  for prefix, args in pending:
+    remaining = unloaded_suffixes.pop(args, SUFFIXES)
+    suffixes = tuple(s for s in remaining if key.endswith(SUFFIX_ENDINGS[s]))
+    if len(suffixes) < len(remaining):
+      unloaded_suffixes[args] = tuple(s for s in remaining if not key.endswith(SUFFIX_ENDINGS[s]))
+      form_trie.add_pending(prefix, args)
+    if suffixes:
+      loads.append((args, suffixes))
+  return loads
+
+def word_loads(word: str) -> list[tuple[tuple, tuple]]:
+  key = form_key(word)
+  load_verbs(key)
+  return take_loads(key, form_trie.take_pending(key))
+
+def spelling_loads(key: str) -> list[tuple[tuple, tuple]]:
+  key = form_key(key)
+  load_verbs(key)
+  return take_loads(key, form_trie.take_pending(key))
 
 def load_candidates(word):
-  word = shorten_vowels(word)
-  for i in reversed(range(len(word) + 1)):
-    if word[:i] in unloaded_prefixes:
-      for args in unloaded_prefixes[word[:i]]:
-        #print("loading", args[0].root+'.'+'.'.join(str(x) for x in args[1:]))
-        load_suffixed_forms(*args)
-      del unloaded_prefixes[word[:i]]
+  for args, suffixes in word_loads(word):
+    #print("loading", args[0].root+'.'+'.'.join(str(x) for x in args[1:]))
+    load_suffixed_forms(*args, suffixes=suffixes)
+
+# A word sees only the unsuffixed glosses and those loaded from the paradigm
+# cells that it loads itself, that is, those with a key that matches its form key
+# as in `FormTrie.take_pending`, whether or not an earlier word loaded them
+# first.  Its glosses therefore do not depend on the words looked up before it.
+
+def visible_glosses(form: str, word_key: str) -> list[KamilDecomposition]:
+  # The glosses of the form visible to a word with the given form key.  The
+  # glosses are sorted, since the order in which they were loaded depends on the
+  # earlier words too.
+  return [decoded(gloss) for key, gloss in sorted(forms_to_glosses[form].items())
+          if (form, key) not in suffixed_cells or
+             any(word_key.startswith(ungeminate_consonants(prefix))
+                 for args in suffixed_cells[(form, key)] for prefix in cell_prefixes[args])]
+
+def candidate_glosses(word) -> list[tuple[str, list[KamilDecomposition]]]:
+  # The forms that differ from `word` only in vowel length, gemination, and
+  # n-assimilation, with their glosses, provided that some form differs from it
+  # only in vowel length and n-assimilation.
+  load_candidates(word)
+  shortened = shorten_vowels(word)
+  normalized = normalize_n_assimilation(shortened)
+  key = ungeminate_consonants(normalized)
+  forms = form_trie.forms_by_shortened(shortened)
+  if normalized not in forms:
+    return []
+  candidates = [(form, visible_glosses(form, key))
+                for form in sorted(form for group in forms.values() for form in group)]
+  candidates = [(form, glosses) for form, glosses in candidates if glosses]
+  if not any(form in forms[normalized] for form, _ in candidates):
+    return []
+  return candidates
+
+def spelled_glosses(transliteration: str) -> list[tuple[str, list[KamilDecomposition]]]:
+  # The forms that the syllabic transliteration can spell, with their glosses.
+  # The trie is walked once along the reading of the spelling without vowel
+  # length or gemination, and only the forms found there are matched against
+  # the spelling.
+  key, pattern = grammar.spelling_matcher(transliteration)
+  for args, suffixes in spelling_loads(key):
+    load_suffixed_forms(*args, suffixes=suffixes)
+  key = form_key(key)
+  candidates = [(form, visible_glosses(form, key))
+                for form in form_trie.forms_ungeminated(key)
+                if pattern.fullmatch(grammar.nfd(form))]
+  return [(form, glosses) for form, glosses in candidates if glosses]
+
+def form_glosses(form: str) -> list[KamilDecomposition]:
+  # All the glosses of the form, whatever word loaded them.
+  return [decoded(gloss) for gloss in forms_to_glosses[form].values()]
+
+def index_entries():
+  global indexed_entries
+  for i in range(indexed_entries, len(lexicon_entries)):
+    form, gloss = lexicon_entries[i]
+    gloss = decoded(gloss)
+    lexicon_entries[i] = (form, gloss)
+    for feature in gloss.features():
+      feature_postings[feature].add(i)
+    feature_postings[gloss.stem()].add(i)
+  indexed_entries = len(lexicon_entries)
+
+def feature_query(*features: grammar.MetalanguageElement|Stem) -> list[tuple[str, KamilDecomposition]]:
+  # The (form, gloss) entries of the lexicon whose glosses have all the given
+  # features, in the order in which they were added; for instance,
+  # feature_query(Stem.G, Label.tan, Label.IMPFV, DirectObject(Person(3),
+  # Gender.F, Number.SG)).  Only the loaded entries are found: the suffixed
+  # forms are loaded by the lookups that need them.
+  index_entries()
+  if not features:
+    return list(lexicon_entries)
+  postings = sorted((feature_postings.get(feature, set()) for feature in features), key=len)
+  return [lexicon_entries[i] for i in sorted(postings[0].intersection(*postings[1:]))]
+
+def features_by_name() -> dict[str, grammar.MetalanguageElement|Stem]:
+  # The features in the index, by their names in the glosses, and the stems.
+  index_entries()
+  features : dict[str, grammar.MetalanguageElement|Stem] = {
+    str(feature): feature for feature in feature_postings}
+  features.update((str(stem), stem) for stem in Stem)
+  return features
+
+# The paradigms derived by `add_verbs`, cached on disk so that they are not
+# rederived every time.  The cache is keyed by a fingerprint of the rules; set
+# GLOSSATOR_LEXICON_CACHE to use a different file, or to the empty string to
+# disable the cache.  It is rewritten at exit if any verb was derived.
+# The cache is read-only once written, and mapped into memory rather than read,
+# so that only the verbs that are loaded are decoded, and so that the processes
+# using it share the pages of the file.  It comprises a header (CACHE_HEADER:
+# magic, fingerprint, offset of the index), the entries of each verb, and an
+# index of them (CACHE_COUNT, then CACHE_RECORD, that is the length of the key,
+# offset and length of the entries, followed by the UTF-8 key, for each verb).
+# The entries of a verb are the pickled number of entries and pending loads of
+# each stem, preceded by their length (CACHE_COUNT), then each entry
+# (CACHE_ENTRY: the lengths of the form, gloss string and pickled gloss,
+# followed by them, the strings in UTF-8).  Loading a verb decodes only the
+# strings; the gloss of an entry is unpickled by the first lookup that returns
+# it, so that a process holds only the glosses that it uses.
+CACHE_PATH = os.environ.get(
+  'GLOSSATOR_LEXICON_CACHE',
+  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon.cache'))
+CACHE_MAGIC = b'GLOSSLX2'
+CACHE_HEADER = struct.Struct('<8s32sQ')
+CACHE_COUNT = struct.Struct('<Q')
+CACHE_RECORD = struct.Struct('<HQQ')
+CACHE_ENTRY = struct.Struct('<HHI')
+
+def fingerprint() -> str:
+  h = hashlib.sha256()
+  for module in ('grammar.py', 'form_trie.py', 'lexicon_shards.py', 'lexicon.py'):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), module), 'rb') as f:
+      h.update(f.read())
+  return h.hexdigest()
+
+# The mapped cache, and the (offset, length) of the entries of each verb in it.
+cache_map : mmap.mmap|None = None
+cached_records : dict[str, tuple[int, int]] = {}
+
+def read_cache_index(mapped: mmap.mmap) -> dict[str, tuple[int, int]]|None:
+  magic, digest, index_offset = CACHE_HEADER.unpack_from(mapped)
+  if magic != CACHE_MAGIC or digest != bytes.fromhex(fingerprint()):
+    return None
+  records = {}
+  (count,) = CACHE_COUNT.unpack_from(mapped, index_offset)
+  position = index_offset + CACHE_COUNT.size
+  for _ in range(count):
+    key_length, offset, length = CACHE_RECORD.unpack_from(mapped, position)
+    position += CACHE_RECORD.size
+    records[mapped[position:position + key_length].decode('utf-8')] = (offset, length)
+    position += key_length
+  return records
+
+def load_cache() -> bool:
+  global cache_map, cached_records
+  if not CACHE_PATH:
+    return False
+  try:
+    with open(CACHE_PATH, 'rb') as f:
+      mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except (OSError, ValueError):
+    # A missing or empty cache is just rebuilt.
+    return False
+  try:
+    records = read_cache_index(mapped)
+  except (struct.error, UnicodeDecodeError):
+    records = None
+  if records is None:
+    mapped.close()
+    return False
+  cache_map, cached_records = mapped, records
+  return True
+
+def cached_verb_entries(key: str) -> list[tuple[list[tuple[str, str, KamilDecomposition|CachedGloss]], list[tuple[str, tuple]]]]|None:
+  record = cached_records.get(key)
+  if cache_map is None or record is None:
+    return None
+  offset, length = record
+  try:
+    (stems_length,) = CACHE_COUNT.unpack_from(cache_map, offset)
+    position = offset + CACHE_COUNT.size
+    stems = pickle.loads(cache_map[position:position + stems_length])
+    position += stems_length
+    verb_stems = []
+    for count, pending in stems:
+      entries : list[tuple[str, str, KamilDecomposition|CachedGloss]] = []
+      for _ in range(count):
+        form_length, key_length, gloss_length = CACHE_ENTRY.unpack_from(cache_map, position)
+        position += CACHE_ENTRY.size
+        form = cache_map[position:position + form_length].decode('utf-8')
+        position += form_length
+        gloss_key = cache_map[position:position + key_length].decode('utf-8')
+        position += key_length
+        entries.append((form, gloss_key, CachedGloss(position, gloss_length)))
+        position += gloss_length
+      verb_stems.append((entries, pending))
+    if position != offset + length:
+      return None
+    return verb_stems
+  except Exception:
+    # A truncated or otherwise unreadable entry is just rederived.
+    return None
+
+def encoded_verb_entries(key: str) -> bytes:
+  stems = verb_entries[key]
+  data = pickle.dumps([(len(entries), pending) for entries, pending in stems], pickle.HIGHEST_PROTOCOL)
+  parts = [CACHE_COUNT.pack(len(data)), data]
+  for entries, _ in stems:
+    for form, gloss_key, gloss in entries:
+      encoded_form = form.encode('utf-8')
+      encoded_key = gloss_key.encode('utf-8')
+      data = pickle.dumps(decoded(gloss), pickle.HIGHEST_PROTOCOL)
+      parts += [CACHE_ENTRY.pack(len(encoded_form), len(encoded_key), len(data)),
+                encoded_form, encoded_key, data]
+  return b''.join(parts)
+
+def save_cache():
+  # Writes the entries of the verbs of the existing cache, copied without being
+  # decoded, along with those derived by this process.
+  if not CACHE_PATH or not derived_keys:
+    return
+  temporary_path = '%s.%d.tmp' % (CACHE_PATH, os.getpid())
+  try:
+    with open(temporary_path, 'wb') as f:
+      f.write(bytes(CACHE_HEADER.size))
+      records : dict[str, tuple[int, int]] = {}
+      derived = set(derived_keys)
+      for key, (offset, length) in cached_records.items():
+        if key not in derived:
+          records[key] = (f.tell(), length)
+          f.write(cache_map[offset:offset + length])
+      for key in derived_keys:
+        data = encoded_verb_entries(key)
+        records[key] = (f.tell(), len(data))
+        f.write(data)
+      index_offset = f.tell()
+      f.write(CACHE_COUNT.pack(len(records)))
+      for key, (offset, length) in records.items():
+        encoded_key = key.encode('utf-8')
+        f.write(CACHE_RECORD.pack(len(encoded_key), offset, length))
+        f.write(encoded_key)
+      f.seek(0)
+      f.write(CACHE_HEADER.pack(CACHE_MAGIC, bytes.fromhex(fingerprint()), index_offset))
+    os.replace(temporary_path, CACHE_PATH)
+  except OSError:
+    if os.path.exists(temporary_path):
+      os.remove(temporary_path)
+
+load_cache()
+atexit.register(save_cache)
 
 if False:
-  for prefix, verbs in unloaded_prefixes.items():
-    print(prefix, ','.join(v[0].root+'.'+'.'.join(str(x) for x in v[1:]) for v in verbs))
-
-for form in forms_to_glosses:
-  forms = shortened_forms_to_forms[shorten_vowels(form)]
-  if form not in forms:
-    forms.append(form)
-    forms.sort()
-  forms = ungeminated_forms_to_forms[ungeminate_consonants(shorten_vowels(form))]
-  if form not in forms:
-    forms.append(form)
-    forms.sort()
\ No newline at end of file
+  for prefix, args in form_trie.pending_loads():
+    print(prefix, args[0].root+'.'+'.'.join(str(x) for x in args[1:]))
@@ -0,0 +1,83 @@
+# The derivation of the lexicon entries for one verb in one stem, independently
+# of any other.  This module has no import-time side effects, so that the
+# derivation can run in worker processes without building the lexicon there.
+
+from grammar import (ALL_PERSONS, Gender, KamilDecomposition, Label, Number, Person, Stem, Verb, WEAK_CONSONANTS,
+                     acc_pronominal_suffix, dat_pronominal_suffix, normalize_n_assimilation, shorten_vowels,
+                     ungeminate_consonants)
+
+def stem_tenses(verb: Verb, stem: Stem) -> list[tuple[bool, None|Label]]:
+  # The tenses of the stem in the lexicon, as (perfective, t or tan infix).
+  tenses : list[tuple[bool, None|Label]] = [(False, None), (True, None), (True, Label.t)]
+  if stem != Stem.N:
+    tenses.append((False, Label.t))
+  # H p. 450, no Ntn attested for II-weak and I-w.
+  if not (stem == Stem.N and
+          (verb.root[1] in WEAK_CONSONANTS or verb.root[0] == 'w')):
+    tenses.append((False, Label.tan))
+  return tenses
+
+def stem_entries(verb: Verb, stem: Stem) -> tuple[list[KamilDecomposition], list[tuple[str, tuple]]]:
+  # The unsuffixed forms of the verb in the stem, and the pending loads of their
+  # suffixed forms, keyed by the start of the form that the enclitics leave
+  # alone, with n assimilated to a following consonant as in the words looked
+  # up.  A final n of the key is dropped, since whether it assimilates depends on
+  # what follows it.
+  glosses : list[KamilDecomposition] = []
+  pending : list[tuple[str, tuple]] = []
+  for ((p, g, n), pftv, t), gloss in verb.paradigm(stem, stem_tenses(verb, stem)).items():
+    glosses.append(gloss)
+    prefix = normalize_n_assimilation(gloss.invariant_prefix())
+    pending.append((prefix[:-1] if prefix.endswith('n') else prefix,
+                    (verb, stem, p, g, n, *(() if t is None else (t,)), 'pftv' if pftv else 'impfv')))
+  return glosses, pending
+
+# The enclitics of the suffixed forms of a paradigm cell, as (object case,
+# object, -ma, ventive, subjunctive).
+SUFFIXES : tuple[tuple[str, tuple[Person, Gender, Number]|None, bool, bool, bool], ...] = tuple(
+  (obj, acc, conj, vent, subj)
+  for obj in ('acc', 'dat')
+  for acc in ALL_PERSONS + [None]
+  for conj in (False, True)
+  for vent in (False, True)
+  for subj in ((False,) if vent else (False, True)))
+
+def suffix_endings(obj: str, acc: tuple[Person, Gender, Number]|None, conj: bool, vent: bool, subj: bool) -> tuple[str, ...]:
+  # The possible endings of the vowel-shortened, ungeminated text of a form with
+  # these enclitics, one of which it must have.  The object suffixes are left
+  # alone by the rules, except that their š may become s; the ventive ends in m
+  # whatever it contracts or assimilates with.  There is no first person
+  # singular dative suffix.
+  suffix = acc and (acc_pronominal_suffix if obj == 'acc' else dat_pronominal_suffix)(*acc)
+  if suffix:
+    text = shorten_vowels(suffix.text)
+    endings = [text, 's' + text[1:]] if text.startswith('š') else [text]
+  else:
+    endings = ['m' if vent else '']
+  if conj:
+    endings = [ending + 'ma' for ending in endings]
+  return tuple(ungeminate_consonants(ending) for ending in endings)
+
+SUFFIX_ENDINGS = {suffixes: suffix_endings(*suffixes) for suffixes in SUFFIXES}
+
+def suffixed_forms(verb : Verb, stem, p, g, n, *args, suffixes=SUFFIXES) -> list[KamilDecomposition]:
+  # The forms of the paradigm cell whose loading was deferred with the arguments
+  # `(verb, stem, p, g, n, *args)`, with the given enclitics.
+  glosses : list[KamilDecomposition] = []
+  for obj, acc, conj, vent, subj in suffixes:
+    if 'pftv' in args:
+      gloss = verb.perfective((p, g, n), t=Label.t if Label.t in args else Label.tan if Label.tan in args else None, stem=stem,
+                              conj=conj, vent=vent, subj=subj, **{obj:acc})
+    else:
+      gloss = verb.durative((p, g, n), t=Label.t if Label.t in args else Label.tan if Label.tan in args else None, stem=stem,
+                            conj=conj, vent=vent, subj=subj, **{obj:acc})
+    glosses.append(gloss)
+  return glosses
+
+def law_entries(loads: list[list[tuple[tuple, tuple]]]) -> list[list[list[tuple[str, str, KamilDecomposition]]]]:
+  # The (form, gloss string, gloss) entries of each of the loads taken by each
+  # of the words of a law, given their (arguments, enclitics).
+  return [[[(gloss.text(), str(gloss), gloss)
+            for gloss in suffixed_forms(*args, suffixes=suffixes)]
+           for args, suffixes in word_loads]
+          for word_loads in loads]
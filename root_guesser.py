@@ -0,0 +1,134 @@
+# Guesses the verbs of words whose roots are not in the lexicon.  The forms of
+# placeholder roots of each shape give templates of the prefixes, infixes and
+# radicals of every stem, tense and person; a word matching a template yields
+# the radicals of a hypothetical root, which is confirmed by deriving its forms
+# for the enclitics that the word can end with.  Like lexicon_shards, this
+# module has no import-time side effects.
+
+import functools
+import re
+
+from grammar import (ALL_PERSONS, CONSONANTS, STRONG_CONSONANTS, TENSES, Gender, KamilDecomposition, Label, Number,
+                     Person, Stem, Verb, normalize_n_assimilation, shorten_vowels, ungeminate_consonants)
+from lexicon_shards import SUFFIX_ENDINGS, SUFFIXES
+
+# The placeholder radicals, and the consonants that each of them stands for.
+# None of the rules singles out p, q or k, and none of the affixes contains
+# them; ṣ stands for the first radicals to which the t infix assimilates.
+PLACEHOLDERS = {
+  'p': ''.join(STRONG_CONSONANTS),
+  'q': ''.join(STRONG_CONSONANTS),
+  'k': ''.join(STRONG_CONSONANTS),
+  'ṣ': 'dṭsṣ',
+}
+
+# The shapes of the roots that are guessed, as placeholder roots whose weak
+# radicals stand for themselves; ʿ also stands for ḥ, which colours a alike.
+ROOT_SHAPES = (
+  'pqk', 'ṣqk', 'nqk',
+  'ʾqk', 'ʿqk', 'wqk', 'yqk',
+  'pʾk', 'pwk', 'pyk',
+  'pqʾ',
+)
+
+# The final radicals that a final radical read off a word may be assimilated
+# from: s before an object suffix, as in ikšussu, and m before -ma, as in
+# irkamma.
+ASSIMILATED_RADICALS = {'s': 'dtṭsṣzš', 'm': 'bm'}
+
+# The (durative, perfective) theme vowels.
+THEME_VOWELS = (('a', 'u'), ('a', 'a'), ('i', 'i'), ('u', 'u'), ('a', 'i'))
+
+# A hypothesis about the verb of a word: (root, theme vowels, stem, perfective,
+# infix, person).
+Hypothesis = tuple[str, tuple[str, str], Stem, bool, Label|None, tuple[Person, Gender, Number]]
+
+def template_pattern(text: str, shape: str) -> str|None:
+  # A pattern matching the start of the words that the form `text` of the
+  # placeholder root `shape` stands for, up to its last placeholder radical,
+  # ignoring vowel length; the placeholders are captured in the order of
+  # `shape`.  None if the form has no placeholder radical.
+  text = shorten_vowels(normalize_n_assimilation(text))
+  end = max(text.rfind(c) for c in shape)
+  if end < 0:
+    return None
+  placeholders = [c for c in shape if c in PLACEHOLDERS]
+  pattern = ''
+  # The groups are opened in order of appearance, which need not be that of
+  # `shape`; they are named after the index of the radical instead.
+  opened : set[str] = set()
+  for c in text[:end + 1]:
+    if c not in placeholders:
+      pattern += re.escape(c)
+    elif c in opened:
+      pattern += '(?P=r%d)' % shape.index(c)
+    else:
+      opened.add(c)
+      pattern += '(?P<r%d>[%s])' % (shape.index(c), PLACEHOLDERS[c])
+  return pattern
+
+@functools.lru_cache(maxsize=None)
+def templates() -> dict[str, tuple[Hypothesis, ...]]:
+  # The hypotheses about the placeholder roots, by template pattern.  Built on
+  # first use, since it derives tens of thousands of forms.
+  hypotheses : dict[str, dict[Hypothesis, None]] = {}
+  for shape in ROOT_SHAPES:
+    for vowels in THEME_VOWELS:
+      verb = Verb(shape, *vowels)
+      for stem in Stem:
+        # A vowel-initial ending may syncopate the vowel before the last
+        # radical, as in iptarsū; the subjunctive stands for these.
+        paradigms = [verb.paradigm(stem, subj=subj) for subj in (False, True)]
+        for pftv, t in TENSES:
+          for p in ALL_PERSONS:
+            for forms in paradigms:
+              if (p, pftv, t) not in forms:
+                # This stem and tense are not formed for roots of this shape.
+                continue
+              pattern = template_pattern(forms[(p, pftv, t)].text(), shape)
+              if pattern is not None:
+                hypotheses.setdefault(pattern, {})[(shape, vowels, stem, pftv, t, p)] = None
+  return {pattern: tuple(shaped) for pattern, shaped in hypotheses.items()}
+
+@functools.lru_cache(maxsize=None)
+def compiled_templates() -> list[tuple[re.Pattern[str], tuple[Hypothesis, ...]]]:
+  return [(re.compile(pattern), shaped) for pattern, shaped in templates().items()]
+
+def hypotheses(word: str) -> list[Hypothesis]:
+  # The hypotheses whose template the word matches, with the radicals of the
+  # root read off the word.
+  shortened = shorten_vowels(normalize_n_assimilation(word))
+  found : dict[Hypothesis, None] = {}
+  for pattern, shaped in compiled_templates():
+    match = pattern.match(shortened)
+    if not match:
+      continue
+    radicals = match.groupdict()
+    for shape, vowels, stem, pftv, t, p in shaped:
+      root = ''.join(radicals.get('r%d' % i, c) if c in PLACEHOLDERS else c
+                     for i, c in enumerate(shape))
+      if not all(c in CONSONANTS for c in root):
+        continue
+      for final in ASSIMILATED_RADICALS.get(root[-1], root[-1]):
+        found[(root[:-1] + final, vowels, stem, pftv, t, p)] = None
+  return list(found)
+
+def guessed_glosses(word: str) -> list[KamilDecomposition]:
+  # The glosses of the word as a form of a guessed root, confirmed by deriving
+  # the forms of each hypothesis with the enclitics that the word can end with;
+  # the forms are compared up to vowel length.
+  shortened = shorten_vowels(normalize_n_assimilation(word))
+  key = ungeminate_consonants(shortened)
+  glosses : dict[str, KamilDecomposition] = {}
+  for root, vowels, stem, pftv, t, p in hypotheses(word):
+    verb = Verb(root, *vowels)
+    for obj, acc, conj, vent, subj in SUFFIXES:
+      if not key.endswith(SUFFIX_ENDINGS[(obj, acc, conj, vent, subj)]):
+        continue
+      try:
+        gloss = verb.finite_form(p, pftv, t=t, stem=stem, conj=conj, vent=vent, subj=subj, **{obj: acc})
+      except ValueError:
+        continue
+      if shorten_vowels(normalize_n_assimilation(gloss.text())) == shortened:
+        glosses.setdefault(str(gloss), gloss)
+  return list(glosses.values())
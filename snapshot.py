@@ -0,0 +1,134 @@
+# A regression check of the derivations against snapshots of them.
+#
+#   python snapshot.py [--update] [--jobs=N] [--roots=ROOT,...] [--snapshots=PATH]
+#
+# Derives every form of every verb of the inventory in each of its stems, for
+# each person, tense of the lexicon (see `stem_tenses`), and set of enclitics
+# (see `SUFFIXES`), sharded by verb and stem across N processes (by default one
+# per CPU), and compares them with the snapshots (by default in the snapshots
+# directory next to this file), printing the forms whose derivation changed,
+# appeared or disappeared, and exiting with status 1 if any did.  --update
+# replaces the snapshots with the current derivations instead; take them before
+# changing the rules.  Like the benchmark baseline, the snapshots are not checked
+# in; the glosses of the corpus are checked in as glosses.txt.  --roots limits
+# the check to the verbs with the given roots.
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+import gzip
+import os
+import sys
+
+from grammar import ALL_PERSONS, DirectObject, IndirectObject, Label, Stem, Verb
+import lexicon
+from lexicon_shards import SUFFIXES, stem_tenses
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOTS_PATH = next(
+  (arg.split('=', 1)[1] for arg in sys.argv[1:] if arg.startswith('--snapshots=')),
+  os.path.join(DIRECTORY, 'snapshots'))
+UPDATE = '--update' in sys.argv
+JOBS = next((int(arg.split('=', 1)[1]) for arg in sys.argv[1:] if arg.startswith('--jobs=')),
+            0)
+ROOTS = next((arg.split('=', 1)[1].split(',') for arg in sys.argv[1:] if arg.startswith('--roots=')),
+             None)
+# The number of changed forms shown for each verb and stem.
+SHOWN_CHANGES = 10
+
+# The sets of enclitics, without the repetitions of those without an object.
+ENCLITICS = tuple(suffixes for suffixes in SUFFIXES if suffixes[1] is not None or suffixes[0] == 'acc')
+
+def enclitics_name(obj: str, acc, conj: bool, vent: bool, subj: bool) -> str:
+  names = []
+  if acc:
+    names.append(str((DirectObject if obj == 'acc' else IndirectObject)(*acc)))
+  if vent:
+    names.append('VENT')
+  if subj:
+    names.append('SUBJ')
+  if conj:
+    names.append('CONJ')
+  return '-'.join(names)
+
+def snapshot_name(verb: Verb, stem: Stem) -> str:
+  return '%s.%s%s.%s.gz' % (verb.root, verb.durative_vowel, verb.perfective_vowel, stem)
+
+def derivations(verb: Verb, stem: Stem) -> list[str]:
+  # The derivations of the forms of the verb in the stem, one per line, as
+  # tab-separated tense, person, enclitics and decomposition, or the error
+  # raised by the derivation.
+  tenses = stem_tenses(verb, stem)
+  lines = []
+  for obj, acc, conj, vent, subj in ENCLITICS:
+    enclitics = enclitics_name(obj, acc, conj, vent, subj)
+    forms = verb.paradigm(stem, tenses, conj=conj, vent=vent, subj=subj, **{obj: acc})
+    for p in ALL_PERSONS:
+      for pftv, t in tenses:
+        gloss = forms.get((p, pftv, t))
+        if gloss is None:
+          # `paradigm` leaves out the forms that cannot be derived.
+          try:
+            verb.finite_form(p, pftv, t=t, stem=stem, conj=conj, vent=vent, subj=subj, **{obj: acc})
+            derivation = 'missing from the paradigm'
+          except ValueError as e:
+            derivation = 'ValueError: %s' % e
+        else:
+          derivation = str(gloss).replace('\n', '  ')
+        lines.append('\t'.join(('.'.join(str(l) for l in (t, Label.PFTV if pftv else Label.IMPFV) if l),
+                                '.'.join(str(x) for x in p), enclitics, derivation)))
+  return lines
+
+def read_snapshot(path: str) -> dict[str, str]:
+  # The derivations in the snapshot, by tense, person and enclitics.
+  with gzip.open(path, 'rt', encoding='utf-8') as f:
+    return dict(line.rstrip('\n').rsplit('\t', 1) for line in f)
+
+def changes(old: dict[str, str], new: list[str]) -> Iterator[str]:
+  seen = set()
+  for line in new:
+    key, derivation = line.rsplit('\t', 1)
+    seen.add(key)
+    if key not in old:
+      yield '+ %s\t%s' % (key, derivation)
+    elif old[key] != derivation:
+      yield '- %s\t%s\n+ %s\t%s' % (key, old[key], key, derivation)
+  for key, derivation in old.items():
+    if key not in seen:
+      yield '- %s\t%s' % (key, derivation)
+
+def main() -> int:
+  shards = [(verb, stem) for verb, stems in lexicon.inventory
+            if ROOTS is None or verb.root in ROOTS for stem in stems]
+  os.makedirs(SNAPSHOTS_PATH, exist_ok=True)
+  changed_forms = 0
+  forms = 0
+  with ProcessPoolExecutor(JOBS or None) as executor:
+    # `map` yields the derivations in the order of the shards.
+    for (verb, stem), lines in zip(shards, executor.map(derivations, *zip(*shards))):
+      forms += len(lines)
+      path = os.path.join(SNAPSHOTS_PATH, snapshot_name(verb, stem))
+      if UPDATE:
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+          f.writelines(line + '\n' for line in lines)
+        continue
+      if not os.path.exists(path):
+        print('No snapshot of %s %s %s%s' % (stem, verb.root, verb.durative_vowel, verb.perfective_vowel))
+        changed_forms += len(lines)
+        continue
+      shard_changes = list(changes(read_snapshot(path), lines))
+      if shard_changes:
+        print('=== %s %s %s%s: %d forms changed' % (stem, verb.root, verb.durative_vowel, verb.perfective_vowel,
+                                                  len(shard_changes)))
+        for change in shard_changes[:SHOWN_CHANGES]:
+          print(change)
+        if len(shard_changes) > SHOWN_CHANGES:
+          print('...')
+      changed_forms += len(shard_changes)
+  if UPDATE:
+    print('Snapshotted %d forms of %d verbs and stems' % (forms, len(shards)))
+    return 0
+  print('%d of %d forms of %d verbs and stems changed' % (changed_forms, forms, len(shards)))
+  return 1 if changed_forms else 0
+
+if __name__ == '__main__':
+  sys.exit(main())